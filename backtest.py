@@ -4,20 +4,72 @@ Created on Wed Sep 16 17:15:30 2015
 
 @author: Yibing
 """
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
 from data_handler import CSVDataHandler
 from order_handler import OrderHandler
-from position_handler import PositionHandler
+from position_handler import PositionHandler, PositionLedger
 from performance import Performance
+from online_performance import OnlinePerformance
 from strategy.buy_hold import BuyHold
 from strategy.sma_cross import MovingAverage
 
+#        52 weeks in a year
+#        250 days in a year
+#        250 * 4 hours 
+#        250 * 4 * 60 minutes
+#        250 * 4 * 60 * 60 seconds
+PERIODS = 250 * 4 * 12.
+
+
+def strategy_features(strategy_classes, strategy_params):
+    """Union of the features of several strategies, a feature declared by
+    more than one strategy is computed once.
+    """
+    features = OrderedDict()
+    for cls, params in zip(strategy_classes, strategy_params):
+        for f in cls.features(**params):
+            if features.setdefault(f.name, f) != f:
+                raise ValueError('Feature %s is declared differently by two '
+                                 'strategies' % f.name)
+    return list(features.values())
+
+
+def create_data_handler(data_handler_cls, strategy_cls, tickers, benchmarks,
+                        strategy_params):
+    """Prepare the features of the strategy and load the market data.
+    
+    strategy_cls and strategy_params may also be lists, of the strategies
+    sharing the data handler.
+    """
+    if isinstance(strategy_cls, (list, tuple)):
+        classes, params = list(strategy_cls), list(strategy_params)
+    else:
+        classes, params = [strategy_cls], [strategy_params]
+    if all(hasattr(c, 'features') for c in classes) and \
+            data_handler_cls.supports_features:
+        # the features are computed in memory, no file round trip
+        features = strategy_features(classes, params)
+        return data_handler_cls(tickers, benchmarks, features=features)
+    if len(classes) > 1:
+        # the processed files of the strategies would overwrite each other
+        raise ValueError('Several strategies need a data handler computing '
+                         'their features')
+    classes[0].csv_processor(tickers, **params[0])
+    return data_handler_cls(tickers, benchmarks)
+
 
 class Backtest(object):
     """Enscapsulates the settings and components for carrying out
     an event-driven backtest. 
     
+    Several strategies can be backtested in one pass over the data. Each
+    of them has its own position handler, order handler and performance,
+    they share the data handler and the market data of each bar.
+    
     Parameters
     ----------
     tickers : list of string
@@ -27,83 +79,370 @@ class Backtest(object):
         Handles the market data feed.
     order_handler_cls : (Class) 
         Keeps track of current and prior positions.
-    strategy_cls : (Class) 
+    strategy_cls : (Class) or list of (Class)
         Generates signals based on market data.
+    strategy_params : dictionary, optional
+        Keyword arguments of the strategy, e.g. the window lengths. A list
+        of dictionaries for a list of strategies.
+    allocation : list of float, optional
+        For a list of strategies sharing the initial capital, the fraction 
+        of it given to each one. By default each strategy trades the whole
+        initial capital on its own.
     
     Attributes
     ----------
     tickers : list
     data_handler : instance
+    position_handlers : list of instances
+    order_handlers : list of instances
+    strategies : list of instances
     position_handler : instance
-    order_handler : instance
-    stragegy : instance
+        The position handler of the first strategy, likewise order_handler,
+        strategy, position_record, account_record and performance.
     transactions : int
+        Number of transactions of all the strategies.
+    transaction_counts : list of int
+    position_records : list of DataFrames
+        The positions of each ticker at each bar, built on demand, see 
+        PositionLedger.to_frame.
+    account_records : list of DataFrames
+        The cash and total of each strategy, all the performance needs.
+    performances : list of instances
+    online_performances : list of OnlinePerformance
+        The figures of each strategy, updated while the backtest runs.
+    online_performance : OnlinePerformance
+        Of the first strategy.
+    combined_record : DataFrame
+        With an allocation, the cash and total of the whole capital.
+    combined_performance : instance
+        With an allocation, the performance of the whole capital.
+    combined_online : OnlinePerformance
+        With an allocation, of the whole capital.
     """
     def __init__(
             self, tickers, benchmarks, initial_capital,
            data_handler_cls, position_handler_cls, order_handler_cls, 
-           strategy_cls, performance_cls
+           strategy_cls, performance_cls, strategy_params=None,
+           allocation=None
         ): 
-        strategy_cls.csv_processor(tickers)
+        if isinstance(strategy_cls, (list, tuple)):
+            strategy_classes = list(strategy_cls)
+            params = list(strategy_params or [{}] * len(strategy_classes))
+        else:
+            strategy_classes = [strategy_cls]
+            params = [strategy_params or {}]
+        assert len(params) == len(strategy_classes), 'one params per strategy'
+        
+        if allocation is None:
+            capitals = [initial_capital] * len(strategy_classes)
+        else:
+            assert len(allocation) == len(strategy_classes), \
+                'one allocation per strategy'
+            assert abs(sum(allocation) - 1.) < 1e-9, 'allocation must sum to 1'
+            capitals = [initial_capital * w for w in allocation]
+        self.allocation = allocation
         
-        self.data_handler = data_handler_cls(tickers, benchmarks)
+        self.data_handler = create_data_handler(data_handler_cls, 
+                                                strategy_classes, tickers, 
+                                                benchmarks, params)
         
-        self.position_handler = position_handler_cls(self.data_handler,
-                                                     initial_capital)
+        self.position_handlers = [position_handler_cls(self.data_handler, c)
+                                  for c in capitals]
                                                      
-        self.order_handler = order_handler_cls(self.data_handler,
-                                               self.position_handler)
+        self.order_handlers = [order_handler_cls(self.data_handler, ph) 
+                               for ph in self.position_handlers]
                                                
-        self.strategy = strategy_cls(self.data_handler, self.position_handler)
+        self.strategies = [cls(self.data_handler, ph, **p) for cls, ph, p in 
+                           zip(strategy_classes, self.position_handlers, params)]
+        
+        self.position_handler = self.position_handlers[0]
+        self.order_handler = self.order_handlers[0]
+        self.strategy = self.strategies[0]
         
         self.performance_cls = performance_cls
         self.transactions = 0
+        self.transaction_counts = [0] * len(self.strategies)
 
-    def simulate_trading(self):
+    @property
+    def supports_blocks(self):
+        """Whether all the strategies generate their signals by block and
+        the data handler holds the whole panel.
+        """
+        return hasattr(self.data_handler, 'panel') and \
+            all(hasattr(s, 'generate_block_signals') for s in self.strategies)
+        
+    @property
+    def position_records(self):
+        return [ph.position_record for ph in self.position_handlers]
+        
+    @property
+    def position_record(self):
+        return self.position_handler.position_record
+    
+    def simulate_trading(self, output=True, block_size=4096, 
+                         keep_history=True):
         """Executes the backtest.
+        
+        Parameters
+        ----------
+        output : bool
+            Whether to print and plot the performance at the end.
+        block_size : int or None
+            Number of bars per block when all the strategies generate their 
+            signals by block, see run_blocks. None to loop bar by bar.
+        keep_history : bool
+            If False, the position handlers only keep the last bar, and the
+            performances are the online ones, see OnlinePerformance. It 
+            must be False with a data handler which keeps no history, e.g.
+            StreamingCSVDataHandler without `history`.
+        """
+        if keep_history and not getattr(self.data_handler, 'history', True):
+            raise ValueError('The data handler keeps no history, use '
+                             'keep_history=False')
+        self.keep_history = keep_history
+        benchmarks = list(self.data_handler.get_benchmark_closes().keys())
+        self.online_performances = [OnlinePerformance(PERIODS, s.name, 
+                                                      benchmarks)
+                                    for s in self.strategies]
+        self.online_performance = self.online_performances[0]
+        if self.allocation is not None:
+            self.combined_online = OnlinePerformance(
+                PERIODS, ' + '.join(s.name for s in self.strategies), 
+                benchmarks)
+        if not keep_history:
+            for position_handler in self.position_handlers:
+                position_handler.ledger = PositionLedger(
+                    position_handler.tickers, history=False)
+            
+        if block_size and self.supports_blocks:
+            self.run_blocks(block_size)
+        else:
+            self.run_bars()
+            
+        self.transactions = sum(self.transaction_counts)
+        print('Number of transactions: %d' % self.transactions)
+        print('\n')
+        
+        self.account_records = [ph.account_record for ph in 
+                                self.position_handlers]
+        if keep_history:
+            self.performances = [self.performance_cls(self.data_handler, r, 
+                                                      PERIODS, s.name)
+                                 for r, s in zip(self.account_records, 
+                                                 self.strategies)]
+        else:
+            # only the last bar is left in the position records
+            self.performances = self.online_performances
+        self.account_record = self.account_records[0]
+        self.performance = self.performances[0]
+        
+        if self.allocation is not None:
+            self.combined_record = pd.DataFrame(
+                dict((c, sum(r[c] for r in self.account_records)) 
+                     for c in ('cash', 'total')), 
+                columns=['cash', 'total'])
+            if keep_history:
+                self.combined_performance = self.performance_cls(
+                    self.data_handler, self.combined_record, PERIODS, 
+                    ' + '.join(s.name for s in self.strategies))
+            else:
+                self.combined_performance = self.combined_online
+        if output:
+            for performance in self.performances:
+                performance.output_performance()
+            if self.allocation is not None:
+                self.combined_performance.output_performance()
+        
+    def run_bars(self):
+        """Calls every strategy at every bar.
         """
+        books = list(zip(self.strategies, self.order_handlers, 
+                         self.position_handlers, 
+                         range(len(self.strategies))))
+        bankrupt = set()
         # loop over each rows to backtest your strategy!
-        for _ in range(self.data_handler.length):
- 
-            # update positions based on newst data
-            self.position_handler.update_from_market()
-
-            # generate signals based on newest data
-            signal = self.strategy.generate_signal()
+        while self.data_handler.continue_backtest:
+            
+            # the market data of the bar, shared by the strategies
+            close = self.data_handler.get_cross_section('close')
+            benchmark_closes = self.data_handler.get_benchmark_closes()
             
-            if signal: 
-                # in this naive backtester, I assume every order will be
-                # executed for sure               
-                execute = self.order_handler.execute_order(signal)
-                # update position from orders and newest market price
-                self.position_handler.update_from_order(execute)
-                self.transactions += 1            
-          
-            # push the account balance
-            self.position_handler.add_one_record()
+            for strategy, order_handler, position_handler, i in books:
+                # update positions based on newst data
+                position_handler.update_from_market(close)
+                
+                # a bankrupt strategy keeps its positions but stops trading
+                signal = None
+                if i not in bankrupt:
+                    self.fill_pending_orders(order_handler, position_handler, 
+                                             i)
+                    signal = strategy.generate_signal()
+                
+                if signal: 
+                    # in this naive backtester, I assume every order will be
+                    # executed for sure               
+                    execute = order_handler.execute_order(signal)
+                    if execute:
+                        # update position from orders and newest market price
+                        position_handler.update_from_order(execute)
+                        self.transaction_counts[i] += 1
+              
+                # push the account balance
+                position_handler.add_one_record()
+                self.online_performances[i].update(
+                    position_handler.current_position['total'], 
+                    benchmark_closes)
+                if not self.keep_history:
+                    position_handler.ledger.discard()
+                
+                if i not in bankrupt and \
+                        position_handler.current_position['total'] < 0:
+                    print('Bankruptcy! GAME OVER for %s' % strategy.name)
+                    bankrupt.add(i)
             
-            if self.position_handler.current_position['total'] < 0:
-                print('Bankruptcy! GAME OVER')
+            if self.allocation is not None:
+                self.combined_online.update(
+                    sum(ph.current_position['total'] for ph in 
+                        self.position_handlers), benchmark_closes)
+            
+            if len(bankrupt) == len(books):
                 break
             
             self.data_handler.cursor += 1
             
-        print('Number of transactions: %d' % self.transactions)
-        print('\n')
+    def fill_pending_orders(self, order_handler, position_handler, i):
+        """Execute the resting orders triggered at the current bar.
+        """
+        for signal, prices in order_handler.triggered_orders():
+            position_handler.update_from_order(
+                order_handler.execute_order(signal, prices))
+            self.transaction_counts[i] += 1
+            
+    def run_blocks(self, block_size):
+        """Asks every strategy for the signals of a block of bars at once.
         
-        self.position_record = pd.DataFrame(self.position_handler.historical_position)
-        self.position_record.set_index('datetime', inplace=True)
-#        52 weeks in a year
-#        250 days in a year
-#        250 * 4 hours 
-#        250 * 4 * 60 minutes
-#        250 * 4 * 60 * 60 seconds
-        periods = 250 * 4 * 12.
-        self.performance = self.performance_cls(self.data_handler,
-                                                self.position_record, 
-                                                periods,
-                                                self.strategy.name)
-        self.performance.output_performance()
+        A strategy of this kind has a `block_fields` list of labels and a
+        `generate_block_signals(start, block)` method, where block is a
+        dictionary of (bars, tickers) views of these fields for the bars 
+        from `start` on. It returns the sorted offsets of the bars with a
+        signal within the block and the list of their signals.
+        
+        Only the bars with a signal or a triggered resting order are 
+        processed one by one, the bars in between are marked to market and 
+        recorded all at once.
+        """
+        panel = self.data_handler.panel
+        length = self.data_handler.length
+        ranges = {}
+        
+        def bar_range(label):
+            # read once a resting order is placed, the data with the close 
+            # only checks the orders against the close
+            if label not in ranges:
+                ranges[label] = panel.field(
+                    label if label in panel.field_loc else 'close')
+            return ranges[label]
+        books = list(zip(self.strategies, self.order_handlers, 
+                         self.position_handlers, 
+                         range(len(self.strategies))))
+        bankrupt = {} # strategy: bar of the bankruptcy
+        
+        def check_bankruptcy(strategy, i, start, total):
+            negative = np.flatnonzero(total < 0)
+            if i not in bankrupt and len(negative):
+                print('Bankruptcy! GAME OVER for %s' % strategy.name)
+                bankrupt[i] = start + negative[0]
+        
+        def mark_to_market(strategy, order_handler, position_handler, i, 
+                           start, end):
+            # the bars without a signal, up to the next triggered order
+            while start < end:
+                trigger = None
+                if order_handler.pending.books and i not in bankrupt:
+                    trigger = order_handler.pending.first_trigger(
+                        bar_range('high')[start:end], 
+                        bar_range('low')[start:end], panel.ticker_loc)
+                stop = end if trigger is None else start + trigger
+                if stop > start:
+                    check_bankruptcy(strategy, i, start, 
+                        position_handler.update_from_market_block(start, stop))
+                if stop == end or i in bankrupt:
+                    start = stop
+                    continue
+                self.data_handler.cursor = stop
+                position_handler.update_from_market(
+                    self.data_handler.get_cross_section('close'))
+                self.fill_pending_orders(order_handler, position_handler, i)
+                position_handler.add_one_record()
+                check_bankruptcy(strategy, i, stop, 
+                    np.array([position_handler.current_position['total']]))
+                start = stop + 1
+        
+        for start in range(0, length, block_size):
+            end = min(start + block_size, length)
+            for strategy, order_handler, position_handler, i in books:
+                offsets, signals = [], []
+                if i not in bankrupt:
+                    block = dict((f, panel.field(f)[start:end]) for f in 
+                                 strategy.block_fields)
+                    offsets, signals = strategy.generate_block_signals(start,
+                                                                       block)
+                bar = start
+                for offset, signal in zip(offsets, signals):
+                    cursor = start + offset
+                    if cursor > bar:
+                        mark_to_market(strategy, order_handler, 
+                                       position_handler, i, bar, cursor)
+                        bar = cursor
+                    if i in bankrupt:
+                        break
+                    
+                    self.data_handler.cursor = cursor
+                    position_handler.update_from_market(
+                        self.data_handler.get_cross_section('close'))
+                    self.fill_pending_orders(order_handler, position_handler, 
+                                             i)
+                    execute = order_handler.execute_order(signal)
+                    if execute:
+                        position_handler.update_from_order(execute)
+                        self.transaction_counts[i] += 1
+                    position_handler.add_one_record()
+                    bar = cursor + 1
+                    check_bankruptcy(strategy, i, cursor, 
+                        np.array([position_handler.current_position['total']]))
+                if bar < end:
+                    mark_to_market(strategy, order_handler, position_handler, 
+                                   i, bar, end)
+                    
+            if len(bankrupt) == len(books):
+                # stop at the bar where the last strategy went bankrupt
+                last = max(bankrupt.values())
+                for position_handler in self.position_handlers:
+                    ledger = position_handler.ledger
+                    ledger.length = last + 1 - ledger.offset
+                self.update_online(start, last + 1)
+                self.data_handler.cursor = last
+                return
+            self.update_online(start, end)
+        self.data_handler.cursor = length
+        
+    def update_online(self, start, end):
+        """Add the bars [start, end) recorded by the position handlers to 
+        the online performances, then drop them from the position handlers
+        if the history is not kept.
+        """
+        closes = dict((b, np.asarray(s.values)[start:end]) for b, s in 
+                      self.data_handler.benchmarks.items())
+        totals = []
+        for position_handler, online in zip(self.position_handlers, 
+                                            self.online_performances):
+            ledger = position_handler.ledger
+            totals.append(ledger.total[start - ledger.offset:
+                                       end - ledger.offset].copy())
+            online.update_block(totals[-1], closes)
+            ledger.discard()
+        if self.allocation is not None:
+            self.combined_online.update_block(sum(totals), closes)
         
 if __name__ == '__main__':
     tickers = ['600030.SH']
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:29:41 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+from drawdown import max_drawdown
+from performance import Performance
+
+
+def _dot(a, b, axis):
+    """Sum of a * b along axis, without the temporary product.
+    """
+    letters = 'ijkl'[:a.ndim]
+    out = letters.replace(letters[axis], '')
+    return np.einsum('%s,%s->%s' % (letters, letters, out), a, b)
+
+
+def skew_kurtosis(num, m2, m3, m4):
+    """Unbiased skewness and excess kurtosis of samples of size num, as 
+    scipy.stats skew and kurtosis(bias=False), from the means of the 2nd,
+    3rd and 4th powers of their deviations. Works on arrays, elementwise.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skewness = m3 / m2 ** 1.5 * np.sqrt(num * (num - 1.)) / (num - 2.)
+        kurt = ((num * num - 1.) * m4 / m2 ** 2 - 3. * (num - 1.) ** 2) / \
+            ((num - 2.) * (num - 3.))
+    return skewness, kurt
+
+
+def figures(returns, periods, axis=0):
+    """The figures of Performance.create_performance for many return series
+    at once.
+
+    Parameters
+    ----------
+    returns : 2d array
+        Returns along `axis`, each series as Performance.returns, i.e.
+        starting with the zero of the first bar.
+    periods : int
+    axis : int
+        Axis along the bars, 0 for (bars, runs) and 1 for (runs, bars).
+
+    Returns
+    -------
+    2d array : (runs, len(Performance.metrics)), in the order of
+        create_performance.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    num = returns.shape[axis]
+    cumulative = returns + 1.
+    np.cumprod(cumulative, axis=axis, out=cumulative)
+    strategy_return = (np.take(cumulative, -1, axis=axis) ** (1. / num) - 1) * \
+        periods
+
+    # central moments, products instead of powers which are much slower
+    mean = returns.mean(axis=axis)
+    dev = returns - np.expand_dims(mean, axis)
+    dev2 = dev * dev
+    m2 = dev2.mean(axis=axis)
+    m3 = _dot(dev2, dev, axis) / num
+    m4 = _dot(dev2, dev2, axis) / num
+    sigma = np.sqrt(m2 * num / (num - 1.)) * np.sqrt(periods)
+    negative = np.minimum(returns, 0.)
+    downside = np.sqrt(_dot(negative, negative, axis) / num) * np.sqrt(periods)
+    max_down = max_drawdown(cumulative, axis=axis, overwrite_input=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = mean * periods / sigma
+        sortino = mean * periods / downside
+    skewness, kurt = skew_kurtosis(num, m2, m3, m4)
+    risk_adjusted = mean * periods - 2.33 * sigma
+
+    return np.column_stack([strategy_return, sigma, downside, max_down,
+                            sharpe, sortino, risk_adjusted, skewness, kurt])
+
+
+def _returns(totals):
+    # as Performance.returns, the first one is zero
+    totals = np.asarray(totals, dtype=np.float64)
+    returns = np.empty_like(totals)
+    returns[0] = 0.
+    returns[1:] = totals[1:] / totals[:-1] - 1.
+    return returns
+
+
+class BatchPerformance(object):
+    """The figures of Performance for many runs at once, e.g. the variants
+    of a sweep, each metric computed for all the runs in one vectorized
+    call.
+
+    Parameters
+    ----------
+    returns : 2d array or DataFrame
+        (bars, runs) returns along a common index, each column as
+        Performance.returns, i.e. starting with the zero of the first bar.
+    periods : int
+    names : list, optional
+        Name of each run, the columns of a DataFrame or their positions by
+        default.
+    benchmark_returns : dictionary, (benchmark: 1d array), optional
+        Returns of each benchmark along the same index.
+
+    Attributes
+    ----------
+    returns : 2d array
+    names : list
+    excess_returns : dictionary, (benchmark: 2d array)
+        (returns - benchmark_returns) of every run.
+    """
+    metrics = Performance.metrics
+    excess_metrics = ('excess_return', 'tracking_error', 'information_ratio')
+
+    def __init__(self, returns, periods, names=None, benchmark_returns=None):
+        if names is None:
+            names = list(returns.columns) if isinstance(returns, pd.DataFrame) \
+                else list(range(np.shape(returns)[1]))
+        self.returns = np.asarray(returns, dtype=np.float64)
+        assert self.returns.ndim == 2 and self.returns.shape[1] == len(names), \
+            'one column of returns per run'
+        self.names = names
+        self.periods = periods
+        self.excess_returns = dict(
+            (b, self.returns - np.asarray(s, dtype=np.float64)[:, np.newaxis])
+            for b, s in (benchmark_returns or {}).items())
+
+    @classmethod
+    def from_totals(cls, totals, periods, names=None, benchmarks=None):
+        """From the totals of the runs and the closes of the benchmarks.
+
+        Parameters
+        ----------
+        totals : 2d array or DataFrame
+            (bars, runs), e.g. the 'total' of several position records.
+        benchmarks : dictionary, (benchmark: 1d array), optional
+            Close of each benchmark along the same index.
+        """
+        if names is None and isinstance(totals, pd.DataFrame):
+            names = list(totals.columns)
+        return cls(_returns(totals), periods, names,
+                   dict((b, _returns(s)) for b, s in
+                        (benchmarks or {}).items()))
+
+    def create_performance(self):
+        """
+        Returns
+        -------
+        DataFrame : one row per run, one column per metric.
+        """
+        return pd.DataFrame(figures(self.returns, self.periods, axis=0),
+                            index=self.names, columns=self.metrics)
+
+    def excess_performance(self):
+        """Annual mean and volatility of the excess returns over each
+        benchmark, and their ratio.
+
+        Returns
+        -------
+        DataFrame : one row per run, columns (benchmark, figure).
+        """
+        frames = {}
+        for b, excess in self.excess_returns.items():
+            mean = Performance.mean_return(excess, self.periods, axis=0)
+            sigma = Performance.volatility(excess, self.periods, axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = mean / sigma
+            frames[b] = pd.DataFrame(np.column_stack([mean, sigma, ratio]),
+                                     index=self.names,
+                                     columns=self.excess_metrics)
+        if not frames:
+            return pd.DataFrame(index=self.names)
+        return pd.concat(frames, axis=1)
+
+    def tidy(self):
+        """All the figures in one long table.
+
+        Returns
+        -------
+        DataFrame : columns run, benchmark, metric and value, one row per
+            figure. The benchmark is empty for the figures of the runs
+            themselves.
+        """
+        own = self.create_performance()
+        own.index.name = 'run'
+        table = own.reset_index().melt(id_vars='run', var_name='metric',
+                                       value_name='value')
+        table.insert(1, 'benchmark', '')
+        tables = [table]
+        for b, frame in self.excess_performance().T.groupby(level=0):
+            frame = frame.droplevel(0).T
+            frame.index.name = 'run'
+            excess = frame.reset_index().melt(id_vars='run', var_name='metric',
+                                              value_name='value')
+            excess.insert(1, 'benchmark', b)
+            tables.append(excess)
+        return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:08:35 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+from batch_performance import figures
+from performance import Performance
+
+
+def block_indices(num, paths, block_size, random_state):
+    """(paths, num) positions of a circular moving block bootstrap, blocks
+    of consecutive bars starting at random positions are glued together.
+    """
+    blocks = -(-num // block_size)
+    starts = random_state.randint(0, num, size=(paths, blocks, 1))
+    idx = (starts + np.arange(block_size)) % num
+    return idx.reshape(paths, blocks * block_size)[:, :num]
+
+
+def shuffle_indices(num, paths, random_state):
+    """(paths, num) positions of random permutations of the bars.
+    """
+    return np.argsort(random_state.random_sample((paths, num)), axis=1)
+
+
+def path_statistics(returns, periods):
+    """The figures of Performance.create_performance for many paths at once.
+
+    Parameters
+    ----------
+    returns : 2d array
+        (paths, bars) returns, each row as Performance.returns.
+    periods : int
+
+    Returns
+    -------
+    2d array : (paths, len(Performance.metrics)), in the order of
+        create_performance.
+    """
+    return figures(returns, periods, axis=1)
+
+
+def bootstrap(returns, periods, paths=10000, method='block', block_size=None,
+              chunk_size=None, seed=None):
+    """Performance figures of resampled return paths.
+
+    The paths are drawn and evaluated as 2d arrays, a chunk of paths at a
+    time to bound the memory.
+
+    Parameters
+    ----------
+    returns : pd.Series or 1d array
+        Returns of the strategy, e.g. Performance.returns. The first one is
+        the placeholder zero of the first bar, it stays in place and the
+        others are resampled.
+    periods : int
+    paths : int
+    method : string
+        'block' for a circular moving block bootstrap, which keeps the
+        autocorrelation within the blocks, or 'shuffle' for permutations.
+    block_size : int, optional
+        The cube root of the number of bars by default.
+    chunk_size : int, optional
+        Number of paths per chunk, about 8MB of returns by default.
+    seed : int, optional
+
+    Returns
+    -------
+    DataFrame : (paths, Performance.metrics)
+    """
+    values = np.asarray(returns, dtype=np.float64)[1:]
+    num = len(values)
+    assert num > 3, 'too few returns to resample'
+    if block_size is None:
+        block_size = max(int(round(num ** (1. / 3))), 1)
+    if chunk_size is None:
+        chunk_size = max(2 ** 20 // num, 1)
+    random_state = np.random.RandomState(seed)
+
+    out = np.empty((paths, len(Performance.metrics)))
+    for start in range(0, paths, chunk_size):
+        n = min(chunk_size, paths - start)
+        if method == 'block':
+            idx = block_indices(num, n, block_size, random_state)
+        elif method == 'shuffle':
+            idx = shuffle_indices(num, n, random_state)
+        else:
+            raise ValueError('Unknown method %s' % method)
+        sample = np.zeros((n, num + 1))
+        sample[:, 1:] = values[idx]
+        out[start:start + n] = path_statistics(sample, periods)
+    return pd.DataFrame(out, columns=Performance.metrics)
+
+
+def confidence_intervals(performance, paths=10000, level=0.95, **kwargs):
+    """Bootstrap confidence intervals of the figures of a Performance.
+
+    Parameters
+    ----------
+    performance : Performance
+    paths : int
+    level : float
+    **kwargs
+        Passed to bootstrap, e.g. method, block_size or seed.
+
+    Returns
+    -------
+    DataFrame : one row per metric, with the estimate of create_performance
+        and the std, lower and upper bounds over the paths.
+    """
+    samples = bootstrap(performance.returns, performance.periods, paths,
+                        **kwargs)
+    values = samples.values
+    values = np.where(np.isfinite(values), values, np.nan)
+    tail = (1. - level) / 2. * 100.
+    with np.errstate(invalid='ignore'):
+        lower, upper = np.nanpercentile(values, [tail, 100. - tail], axis=0)
+    return pd.DataFrame({'estimate': performance.create_performance(),
+                         'std': np.nanstd(values, axis=0, ddof=1),
+                         'lower': lower,
+                         'upper': upper},
+                        index=Performance.metrics,
+                        columns=['estimate', 'std', 'lower', 'upper'])
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:52:58 2026
+
+@author: Yibing
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnarCache(object):
+    """Binary cache of parsed csv files and of the frames derived from them.
+
+    Every entry is a directory holding the index and each column as a
+    separate `.npy` file, which can be memory-mapped when it is loaded,
+    plus a `meta.json` describing the source file it was built from.
+
+    Parameters
+    ----------
+    root : string
+        Directory where the entries are stored.
+
+    Notice
+    ------
+    An entry is keyed by the absolute path of the source csv and a tag,
+    e.g. 'raw' for the parsed file itself or the name of the strategy
+    whose features were computed from it. It is valid as long as the
+    size and the mtime of the source are unchanged. If only the mtime
+    differs, the content hash decides, so touching a file does not
+    invalidate its entries.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def content_hash(path):
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    @staticmethod
+    def stat(path):
+        st = os.stat(path)
+        return {'size': st.st_size, 'mtime': st.st_mtime}
+
+    def fingerprint(self, path):
+        """Size, mtime and content hash of a source file.
+        """
+        fp = self.stat(path)
+        fp['md5'] = self.content_hash(path)
+        return fp
+
+    def entry_dir(self, path, tag):
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.root, key, tag)
+
+    def _read_meta(self, entry):
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry, meta):
+        with open(os.path.join(entry, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def valid_meta(self, path, tag):
+        """Return the meta of the entry if its fingerprint still matches
+        the source file, otherwise None.
+        """
+        entry = self.entry_dir(path, tag)
+        meta = self._read_meta(entry)
+        if meta is None or not os.path.exists(path):
+            return None
+        st = self.stat(path)
+        source = meta['source']
+        if st['size'] != source['size']:
+            return None
+        if st['mtime'] == source['mtime']:
+            return meta
+        if self.content_hash(path) != source['md5']:
+            return None
+        # the file was touched but not changed, remember the new mtime
+        source['mtime'] = st['mtime']
+        self._write_meta(entry, meta)
+        return meta
+
+    def load(self, path, tag='raw', mmap_mode='r'):
+        """Return the cached frame of `path` under `tag`, or None if there
+        is no valid entry.
+        """
+        entry = self.entry_dir(path, tag)
+        meta = self.valid_meta(path, tag)
+        if meta is None:
+            return None
+
+        def read(name, dtype):
+            # object columns are pickled and can not be memory-mapped
+            if dtype == 'object':
+                return np.load(os.path.join(entry, name), allow_pickle=True)
+            return np.load(os.path.join(entry, name), mmap_mode=mmap_mode)
+
+        index = pd.Index(read('index.npy', meta['index_dtype']),
+                         name=meta['index_name'])
+        data = dict((c, read('col_%d.npy' % j, dtype)) for j, (c, dtype) in
+            enumerate(meta['columns']))
+        return pd.DataFrame(data, index=index,
+                            columns=[c for c, _ in meta['columns']])
+
+    def store(self, path, tag, frame, fingerprint=None):
+        """Write `frame` as the entry of `path` under `tag`.
+        """
+        entry = self.entry_dir(path, tag)
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        # build the entry aside and move it in place, so that concurrent
+        # readers never see a half written directory
+        tmp = tempfile.mkdtemp(dir=parent)
+        values = np.asarray(frame.index.values)
+        np.save(os.path.join(tmp, 'index.npy'), values,
+                allow_pickle=values.dtype == object)
+        columns = []
+        for j, c in enumerate(frame.columns):
+            values = np.asarray(frame[c].values)
+            np.save(os.path.join(tmp, 'col_%d.npy' % j), values,
+                    allow_pickle=values.dtype == object)
+            columns.append((c, str(values.dtype)))
+        meta = {'source': fingerprint or self.fingerprint(path),
+                'index_name': frame.index.name,
+                'index_dtype': str(np.asarray(frame.index.values).dtype),
+                'columns': columns}
+        self._write_meta(tmp, meta)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another process has just stored the same entry
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def read_csv(self, path):
+        """Cached equivalent of
+        pd.read_csv(path, index_col=0, parse_dates=True).
+        """
+        frame = self.load(path)
+        if frame is None:
+            fingerprint = self.fingerprint(path)
+            frame = pd.read_csv(path, index_col=0, parse_dates=True)
+            self.store(path, 'raw', frame, fingerprint)
+        return frame
+
+    def derive(self, path, tag, processor, output=None):
+        """Cached result of `processor` applied to the parsed `path`.
+
+        Parameters
+        ----------
+        path : string
+            Source csv file.
+        tag : string
+            Identifies the processor, e.g. the strategy name.
+        processor : function
+            Takes the parsed DataFrame and returns the derived DataFrame.
+        output : string, optional
+            If given, the derived frame is also written to this csv file,
+            which is only rewritten when its content is out of date.
+
+        Returns
+        -------
+        DataFrame
+        """
+        entry = self.entry_dir(path, tag)
+        meta = self.valid_meta(path, tag)
+        frame = None
+        if meta is not None:
+            frame = self.load(path, tag)
+            if output is None or (os.path.exists(output) and
+                    meta.get('output') == [output, self.stat(output)['size'],
+                                           self.stat(output)['mtime']]):
+                return frame
+        if frame is None:
+            fingerprint = self.fingerprint(path)
+            frame = processor(self.read_csv(path))
+            self.store(path, tag, frame, fingerprint)
+            meta = self._read_meta(entry)
+        if output is not None:
+            frame.to_csv(output, index_label='datetime')
+            st = self.stat(output)
+            meta['output'] = [output, st['size'], st['mtime']]
+            self._write_meta(entry, meta)
+        return frame
+
+
+default_cache = ColumnarCache(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\cache')
@@ -4,8 +4,14 @@ Created on Sun Sep 13 23:58:46 2015
 
 @author: Yibing
 """
+import heapq
+
+import numpy as np
 import pandas as pd
-from copy import copy            
+
+from cache import default_cache
+from features import default_pipeline
+from panel import Panel
 
 class CSVDataHandler(object):
     """This is the most common type of datahandler, the csv file contains 
@@ -18,9 +24,17 @@ class CSVDataHandler(object):
         Represents different stocks, also the name of the file.
     benchmarks : list of string
         The close price of the benchmark index along the time.
+    features : list of Indicator, optional
+        If given, the files are read from resampled_data and the features
+        are computed in memory by the feature pipeline, instead of being
+        read from the files processed by the strategy.
     
     Attributes
     ----------
+    window : tuple, (start, end)
+        Only the bars with start <= datetime < end are kept, None for no
+        bound. The features are computed before, on the whole history, so
+        that they are warmed up at the start. Set it with windowed().
     benchmarks : Dictionary, (ticker: pd.Series)
         Close price along the index. Could be multiple benchmarks
     historical_data : Dictionay, (ticker: pd.DataFrame) 
@@ -31,6 +45,14 @@ class CSVDataHandler(object):
         Datetime of each row.
     columns : List of strings
         Labels of each feature   
+    panel : Panel
+        Numeric columns of all tickers in one (time, ticker, field) array.
+    values : Dictionary, (ticker: 2d array)
+        (length, n_columns) view of each ticker into the panel.
+    arrays : Dictionary, (ticker: dictionary (label: 1d array))
+        Column views into the panel, looked up by position.
+    column_loc : Dictionary, (label: int)
+        Position of each numeric column in the rows of `values`.
     
     Example:
     -------
@@ -45,7 +67,10 @@ class CSVDataHandler(object):
     
 
     """
-    def __init__(self, tickers, benchmarks):
+    supports_features = True
+    window = (None, None)
+    
+    def __init__(self, tickers, benchmarks, features=None):
         self.tickers = tickers
         self.benchmarks = {}
         self.historical_data = {}
@@ -53,9 +78,8 @@ class CSVDataHandler(object):
         # Importing data #
         ##################        
         for i, s in enumerate(self.tickers):
-            self.historical_data[s] = pd.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%s, 
-                                                  index_col=0,
-                                                  parse_dates=True)
+            self.historical_data[s] = self.select_window(
+                self.read_ticker(s, features))
                                                  
             # double check whether the indeces of multipe files are matched                                     
             assert (self.historical_data[s].index == \
@@ -69,21 +93,304 @@ class CSVDataHandler(object):
         self.index = self.historical_data[tickers[0]].index
         self.columns = self.historical_data[tickers[0]].columns
         
+        # convert the frames into one array once, so that the lookups 
+        # in the event loop are plain positional indexing
+        self.panel = Panel.from_frames(self.historical_data, self.tickers)
+        self.column_loc = self.panel.field_loc
+        self.values = {}
+        self.arrays = {}
+        for i, s in enumerate(self.tickers):
+            self.values[s] = self.panel.values[:, i, :]
+            self.arrays[s] = dict((c, self.values[s][:, j]) for c, j in 
+                self.column_loc.items())
+        
         for b in benchmarks:
-            self.benchmarks[b] = pd.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%b, 
-                                             index_col=0,
-                                             parse_dates=True).reindex(index=self.index).close
+            self.benchmarks[b] = self.read_benchmark(b).reindex(
+                index=self.index).close
             print('Successfully loaded %s' % (b,))
         print('\n')
 
         self.cursor = 0
         self.length = len(self.index)
     
+    def read_ticker(self, ticker, features=None):
+        """DataFrame of one ticker, override to load data from elsewhere.
+        """
+        if features is None:
+            return default_cache.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%ticker)
+        return default_pipeline.frame(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%ticker,
+                                      features)
+        
+    @classmethod
+    def windowed(cls, start=None, end=None):
+        """Subclass which loads only the bars in [start, end).
+        """
+        return type(cls.__name__, (cls,), {'window': (start, end)})
+        
+    def select_window(self, frame):
+        start, end = self.window
+        i = 0 if start is None else frame.index.searchsorted(pd.Timestamp(start))
+        j = len(frame) if end is None else \
+            frame.index.searchsorted(pd.Timestamp(end))
+        return frame.iloc[i:j]
+        
+    def read_benchmark(self, benchmark):
+        """DataFrame of one benchmark, with a close column.
+        """
+        return default_cache.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%benchmark)
+    
+    def get_datetime(self):
+        return self.index[self.cursor]
+        
+    def get_value(self, ticker, label, cursor=None):
+        """O(1) positional lookup of one field, at the cursor by default.
+        """
+        if cursor is None:
+            cursor = self.cursor
+        return self.arrays[ticker][label][cursor]
+        
+    def get_cursor_row(self, ticker):
+        """View of all numeric fields of the current bar, ordered as 
+        `column_loc`.
+        """
+        return self.values[ticker][self.cursor]
+        
+    def get_cross_section(self, label):
+        """View of one field of all tickers at the current bar, ordered as
+        `tickers`.
+        """
+        return self.panel.cross_section(label, self.cursor)
+        
+    def get_benchmark_closes(self):
+        """Close of each benchmark at the cursor.
+        """
+        return dict((b, s.values[self.cursor]) for b, s in 
+            self.benchmarks.items())
+        
+    def get_window(self, ticker, label, n):
+        """View of the last n values of one field up to the current bar.
+        """
+        return self.panel.window(ticker, label, self.cursor, n)
+        
+    def get_cursor_value(self, ticker, label):
+        # non-numeric columns are not converted, fall back to the frame
+        if label in self.column_loc:
+            return self.arrays[ticker][label][self.cursor]
+        return self.historical_data[ticker][label].iat[self.cursor]
+        
+    def is_halted(self, ticker):
+        # the files are aligned, every ticker has a bar at every index
+        return False
+        
+    @property
+    def continue_backtest(self):
+        return self.cursor < self.length
+
+
+class StreamingCSVDataHandler(object):
+    """Streams the csv files of several tickers chunk by chunk and merges
+    them by timestamp into a single bar feed, so that only `chunksize` rows
+    per file are held in memory and the files need not share an index.
+    
+    Parameters
+    ----------
+    tickers : array-like
+        Represents different stocks, also the name of the file.
+    benchmarks : list of string
+        The close price of the benchmark index along the time.
+    chunksize : int
+        Number of rows read from each file at a time.
+    missing : string
+        What to do at a timestamp where some of the tickers have no bar.
+        'skip' : drop the timestamp, i.e. only the common timestamps are 
+            fed, which is what CSVDataHandler requires.
+        'ffill' : repeat the last bar of the missing tickers.
+        'halt' : repeat the last bar of the missing tickers and mark them
+            as halted, so that no order is executed for them.
+        Before its first bar a ticker is always halted with nan values.
+    history : bool
+        Whether to keep the datetime and the benchmark closes of every bar
+        fed, for `index` and `benchmarks`. Without it only the current bar
+        is kept, and a backtest keeps its history in the position ledger
+        and the online figures, see Backtest.simulate_trading.
+    
+    Attributes
+    ----------
+    columns : List of strings
+        Labels of each numeric feature
+    column_loc : Dictionary, (label: int)
+        Position of each feature in the rows of `current`.
+    current : 2d array
+        (tickers, features) values of the current bar.
+    halted : 1d array of bool
+        Whether each ticker is missing at the current bar.
+    index : pandas DatetimeIndex
+        Datetime of each bar fed so far, only with `history`.
+    benchmarks : Dictionary, (ticker: pd.Series)
+        Close price of each benchmark along `index`, only with `history`.
+        
+    Notice
+    ------
+    The cursor can only move forward one bar at a time. The memory does 
+    not grow with the number of bars unless `history` is set, then by a 
+    timestamp and a benchmark close per bar.
+    Features are not computed on the fly, the files processed by the 
+    strategy are streamed.
+    """
+    supports_features = False
+    
+    def __init__(self, tickers, benchmarks, chunksize=10000, missing='skip',
+                 history=False):
+        assert missing in ('skip', 'ffill', 'halt'), 'unknown policy'
+        self.tickers = tickers
+        self.history = history
+        self.ticker_loc = dict((s, i) for i, s in enumerate(tickers))
+        self.chunksize = chunksize
+        self.missing = missing
+        
+        paths = [u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%s 
+                 for s in tickers]
+        # the numeric columns are inferred from the head of the first file
+        head = pd.read_csv(paths[0], index_col=0, nrows=10)
+        self.columns = [c for c in head.columns if 
+            np.issubdtype(head[c].dtype, np.number)]
+        self.column_loc = dict((c, j) for j, c in enumerate(self.columns))
+        
+        # k-way merge, one (timestamp, stream number, row) per stream
+        self._streams = []
+        self._heap = []
+        for i, path in enumerate(paths):
+            columns = pd.read_csv(path, index_col=0, nrows=0).columns
+            assert set(self.columns) <= set(columns), 'columns not match'
+            self._streams.append(self._iter_rows(path, self.columns))
+            self._push(i)
+            
+        self._benchmark_streams = dict((b, self._iter_rows(
+            u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%b, ['close']))
+            for b in benchmarks)
+        self._benchmark_heads = dict((b, next(it, None)) for b, it in 
+            self._benchmark_streams.items())
+        self._benchmark_closes = dict((b, np.nan) for b in benchmarks)
+        self._benchmark_values = dict((b, []) for b in benchmarks)
+        
+        n = len(tickers)
+        self.current = np.empty((n, len(self.columns)))
+        self.current.fill(np.nan)
+        self._last = self.current.copy()
+        self.halted = np.ones(n, dtype=bool)
+        self._datetime = None
+        self._datetimes = []
+        self._finished = False
+        
+        self._cursor = 0
+        self._next_bar()
+        
+    def _iter_rows(self, path, columns):
+        """Generates (timestamp in ns, row) of a csv file chunk by chunk.
+        """
+        reader = pd.read_csv(path, index_col=0, parse_dates=True, 
+                             chunksize=self.chunksize)
+        for chunk in reader:
+            stamps = chunk.index.values.astype('datetime64[ns]').view('i8')
+            values = chunk[columns].values.astype(np.float64)
+            for k in range(len(stamps)):
+                yield stamps[k], values[k]
+                
+    def _push(self, i):
+        item = next(self._streams[i], None)
+        if item is not None:
+            heapq.heappush(self._heap, (item[0], i, item[1]))
+        
+    def _next_bar(self):
+        n = len(self.tickers)
+        while True:
+            if not self._heap:
+                self._finished = True
+                return
+            stamp = self._heap[0][0]
+            present = np.zeros(n, dtype=bool)
+            while self._heap and self._heap[0][0] == stamp:
+                _, i, row = heapq.heappop(self._heap)
+                # keep the first row of duplicated timestamps
+                if not present[i]:
+                    present[i] = True
+                    self.current[i] = row
+                self._push(i)
+            if present.all() or self.missing != 'skip':
+                break
+            self._last[present] = self.current[present]
+            
+        self._last[present] = self.current[present]
+        self.current[~present] = self._last[~present]
+        if self.missing == 'halt':
+            self.halted = ~present
+        else:
+            # forward filled, only the tickers without any bar yet are halted
+            self.halted = np.isnan(self.current).all(axis=1)
+        
+        self._datetime = stamp
+        for b in self._benchmark_closes:
+            head = self._benchmark_heads[b]
+            while head is not None and head[0] < stamp:
+                head = next(self._benchmark_streams[b], None)
+            self._benchmark_heads[b] = head
+            self._benchmark_closes[b] = head[1][0] if head is not None and \
+                head[0] == stamp else np.nan
+        if self.history:
+            self._datetimes.append(stamp)
+            for b, values in self._benchmark_values.items():
+                values.append(self._benchmark_closes[b])
+            
+    @property
+    def cursor(self):
+        return self._cursor
+        
+    @cursor.setter
+    def cursor(self, value):
+        if value != self._cursor + 1:
+            raise ValueError('The stream can only move forward one bar')
+        self._cursor = value
+        self._next_bar()
+        
+    @property
+    def continue_backtest(self):
+        return not self._finished
+        
+    @property
+    def index(self):
+        if not self.history:
+            raise ValueError('Only the current bar is kept, set history')
+        return pd.DatetimeIndex(np.array(self._datetimes, dtype='datetime64[ns]'))
+        
+    @property
+    def benchmarks(self):
+        index = self.index
+        return dict((b, pd.Series(values, index=index, name='close')) for 
+            b, values in self._benchmark_values.items())
+        
     def get_datetime(self):
-        return copy(self.index[self.cursor])
+        return pd.Timestamp(self._datetime)
+        
+    def get_value(self, ticker, label, cursor=None):
+        if cursor is not None and cursor != self._cursor:
+            raise ValueError('Only the current bar is available')
+        return self.current[self.ticker_loc[ticker], self.column_loc[label]]
+        
+    def get_cursor_row(self, ticker):
+        return self.current[self.ticker_loc[ticker]]
+        
+    def get_cross_section(self, label):
+        return self.current[:, self.column_loc[label]]
         
     def get_cursor_value(self, ticker, label):
-        return copy(self.historical_data[ticker].ix[self.cursor, label])
+        return self.current[self.ticker_loc[ticker], self.column_loc[label]]
+        
+    def is_halted(self, ticker):
+        return self.halted[self.ticker_loc[ticker]]
+        
+    def get_benchmark_closes(self):
+        return dict(self._benchmark_closes)
+        
  
 # Just for testing         
 if __name__ == '__main__':
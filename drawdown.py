@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:25:22 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+
+def _values(curve):
+    return np.asarray(curve, dtype=np.float64)
+
+
+def _wrap(values, like):
+    # the same pandas type as the input, if any
+    if isinstance(like, pd.Series):
+        return pd.Series(values, index=like.index, name=like.name)
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(values, index=like.index, columns=like.columns)
+    return values
+
+
+def running_peak(curve, axis=0):
+    """Highest value so far of each curve.
+    """
+    return _wrap(np.maximum.accumulate(_values(curve), axis=axis), curve)
+
+
+def peak_positions(curve, axis=0):
+    """Position of the last peak at or before each bar, i.e. of the bar
+    where the running peak was set.
+    """
+    values = _values(curve)
+    shape = [1] * values.ndim
+    shape[axis] = values.shape[axis]
+    bars = np.arange(values.shape[axis]).reshape(shape)
+    peak = np.maximum.accumulate(values, axis=axis)
+    return np.maximum.accumulate(np.where(values >= peak, bars, 0), axis=axis)
+
+
+def underwater(curve, axis=0):
+    """Drawdown of each bar, (value - peak) / peak, zero at a new peak.
+
+    Parameters
+    ----------
+    curve : 1d or 2d array, pd.Series or DataFrame
+        Cumulative returns or equity curves, one per column if axis=0.
+    axis : int
+        Axis along the bars.
+
+    Returns
+    -------
+    The same shape and pandas type as curve.
+    """
+    values = _values(curve)
+    peak = np.maximum.accumulate(values, axis=axis)
+    return _wrap((values - peak) / peak, curve)
+
+
+def max_drawdown(curve, axis=0, overwrite_input=False):
+    """Maximal loss before a new peak is formed, in O(n).
+
+    Parameters
+    ----------
+    curve : 1d or 2d array, pd.Series or DataFrame
+    axis : int
+        Axis along the bars.
+    overwrite_input : bool
+        If True and curve is a float64 array, it is used as the scratch
+        space of the underwater values, which saves a copy of it.
+
+    Returns
+    -------
+    float or 1d array : (trough_value - peak_value) / peak_value, zero if
+        the curve never falls.
+    """
+    values = curve if overwrite_input and isinstance(curve, np.ndarray) and \
+        curve.dtype == np.float64 else _values(curve).copy()
+    peak = np.maximum.accumulate(values, axis=axis)
+    values -= peak
+    values /= peak
+    return np.minimum(values.min(axis=axis), 0.)
+
+
+def drawdown_durations(curve, axis=0):
+    """Number of bars since the last peak at each bar, zero at a peak.
+    """
+    values = _values(curve)
+    shape = [1] * values.ndim
+    shape[axis] = values.shape[axis]
+    bars = np.arange(values.shape[axis]).reshape(shape)
+    return _wrap(bars - peak_positions(values, axis), curve)
+
+
+def max_drawdown_positions(curve, axis=0):
+    """Positions of the peak, the trough and the recovery of the maximal
+    drawdown of each curve.
+
+    Returns
+    -------
+    tuple of int or 1d arrays : (peak, trough, recovery), recovery is the
+        first bar after the trough back at the peak, -1 if the curve has
+        not recovered. The three are equal if the curve never falls.
+    """
+    values = np.moveaxis(_values(curve), axis, -1)
+    peak = np.maximum.accumulate(values, axis=-1)
+    trough = np.argmin((values - peak) / peak, axis=-1)
+    trough = np.expand_dims(trough, -1)
+    start = np.take_along_axis(peak_positions(values, -1), trough, -1)
+    level = np.take_along_axis(peak, trough, -1)
+    bars = np.arange(values.shape[-1])
+    recovered = (bars > trough) & (values >= level)
+    recovery = np.where(recovered.any(axis=-1), recovered.argmax(axis=-1), -1)
+    recovery = np.where(start[..., 0] == trough[..., 0], trough[..., 0],
+                        recovery)
+    positions = (start[..., 0], trough[..., 0], recovery)
+    if values.ndim == 1:
+        return tuple(int(p) for p in positions)
+    return positions
+
+
+def drawdown_table(curve):
+    """Every drawdown of one curve, from a peak to the recovery of it.
+
+    Parameters
+    ----------
+    curve : pd.Series or 1d array
+
+    Returns
+    -------
+    DataFrame : one row per drawdown, largest first, with its peak, trough
+        and recovery (NaT or -1 if not recovered), the drawdown and the
+        duration in bars from the peak to the recovery, or to the last bar.
+        The peaks, troughs and recoveries are labels of the index of a
+        Series, positions otherwise.
+    """
+    values = _values(curve)
+    down = underwater(values)
+    # a drawdown is a run of bars under water, after the bar of its peak
+    wet = np.r_[False, down < 0., False]
+    edges = np.flatnonzero(wet[1:] != wet[:-1])
+    first, end = edges[::2], edges[1::2]
+    # the trough of each run is the first bar at the minimum of the run,
+    # the bars between the runs are zero and do not change the minimum
+    troughs = np.zeros(len(first), dtype=int)
+    if len(first):
+        lowest = np.minimum.reduceat(down, first)
+        run = np.searchsorted(first, np.arange(len(values)), 'right') - 1
+        at_low = np.flatnonzero((run >= 0) & (down == lowest[run]) &
+                                (down < 0.))
+        troughs = at_low[np.unique(run[at_low], return_index=True)[1]]
+    peaks = first - 1
+    recoveries = np.where(end < len(values), end, -1)
+    durations = np.where(recoveries >= 0, recoveries, len(values) - 1) - peaks
+    table = pd.DataFrame({'peak': peaks, 'trough': troughs,
+                          'recovery': recoveries,
+                          'drawdown': down[troughs] if len(troughs) else [],
+                          'duration': durations},
+                         columns=['peak', 'trough', 'recovery', 'drawdown',
+                                  'duration'])
+    if isinstance(curve, pd.Series):
+        index = curve.index
+        for c in ('peak', 'trough'):
+            table[c] = index[table[c].values]
+        table['recovery'] = [index[r] if r >= 0 else pd.NaT for r in
+                             recoveries]
+    return table.sort_values('drawdown', kind='mergesort').reset_index(drop=True)
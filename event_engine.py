@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:22:39 2026
+
+@author: Yibing
+"""
+import heapq
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from backtest import PERIODS
+
+# Priorities of the events of the same timestamp, lower first: the market
+# data of every feed is updated before the strategy looks at it, and the
+# orders of a signal are executed before they are filled.
+MARKET, SIGNAL, ORDER, FILL = 0, 1, 2, 3
+
+
+class FrameFeed(object):
+    """Market events of one ticker from a DataFrame indexed by datetime,
+    e.g. the bars of a resampled csv file.
+
+    Parameters
+    ----------
+    ticker : string
+    frame : DataFrame
+    fields : list of string, optional
+        Columns to feed, the numeric columns by default.
+
+    Attributes
+    ----------
+    times : 1d array of int64
+        Nanoseconds since the epoch of each row.
+    values : 2d array
+        (rows, fields)
+    """
+    def __init__(self, ticker, frame, fields=None):
+        if fields is None:
+            fields = [c for c in frame.columns if
+                      np.issubdtype(frame[c].dtype, np.number)]
+        self.ticker = ticker
+        self.fields = list(fields)
+        self.times = np.asarray(frame.index.values,
+                                dtype='datetime64[ns]').view(np.int64)
+        self.values = np.asarray(frame[self.fields].values, dtype=np.float64)
+
+    def __iter__(self):
+        """(timestamp, 1d array of the fields) of each row.
+        """
+        return zip(self.times.tolist(), self.values)
+
+
+class EventDataHandler(object):
+    """Latest market data of each ticker, updated event by event by feeds
+    of any frequency. It answers the same lookups as the CSVDataHandler,
+    about the current time instead of a row of a common index.
+
+    Parameters
+    ----------
+    tickers : list of string
+    benchmarks : list of string
+    fields : list of string
+        The union of the fields of the feeds.
+
+    Attributes
+    ----------
+    current : 2d array
+        (tickers, fields) latest values, nan before the first event of a
+        ticker or for the fields its feeds do not have.
+    cursor : int
+        Number of timestamps processed so far.
+    datetime : int
+        Current timestamp in nanoseconds.
+    index : pd.DatetimeIndex
+        The recorded timestamps, built at the end of the backtest.
+    benchmarks : Dictionary, (ticker: pd.Series)
+        Latest close of each benchmark at the recorded timestamps, built at
+        the end of the backtest.
+    """
+    supports_features = False
+
+    def __init__(self, tickers, benchmarks, fields):
+        self.tickers = tickers
+        self.benchmark_tickers = benchmarks
+        self.column_loc = dict((f, j) for j, f in enumerate(fields))
+        self.ticker_loc = dict((s, i) for i, s in enumerate(tickers))
+        self.current = np.full((len(tickers), len(fields)), np.nan)
+        self.benchmark_close = dict((b, np.nan) for b in benchmarks)
+        self.cursor = 0
+        self.datetime = None
+        self.index = pd.DatetimeIndex([], name='datetime')
+        self.benchmarks = {}
+        self._times = []
+        self._benchmark_values = dict((b, []) for b in benchmarks)
+
+    def update(self, i, columns, values, benchmark=None, close=None):
+        """New values of some fields of a ticker.
+
+        Parameters
+        ----------
+        i : int or None
+            Position of the ticker in `tickers`, None for a benchmark only.
+        columns : list of int or slice
+            Positions of the fields of `values` in `column_loc`.
+        values : 1d array
+        benchmark : string, optional
+            Name of the benchmark, if the ticker is one.
+        close : int, optional
+            Position of the close in `values`, for a benchmark.
+        """
+        if i is not None:
+            self.current[i, columns] = values
+        if benchmark is not None:
+            self.benchmark_close[benchmark] = values[close]
+
+    def record(self):
+        """Keep the current time and benchmark closes, once per timestamp.
+        """
+        self._times.append(self.datetime)
+        for b, v in self.benchmark_close.items():
+            self._benchmark_values[b].append(v)
+
+    def finish(self, length=None):
+        """Build the index and the benchmarks of the recorded timestamps,
+        of the first `length` ones if given.
+        """
+        self.index = pd.DatetimeIndex(np.array(self._times[:length],
+                                               dtype='datetime64[ns]'),
+                                      name='datetime')
+        self.benchmarks = dict((b, pd.Series(v[:length], index=self.index))
+                               for b, v in self._benchmark_values.items())
+
+    def get_datetime(self):
+        return np.datetime64(self.datetime, 'ns')
+
+    def get_value(self, ticker, label, cursor=None):
+        if cursor is not None and cursor != self.cursor:
+            raise ValueError('Only the current time is available')
+        return self.current[self.ticker_loc[ticker], self.column_loc[label]]
+
+    def get_cursor_row(self, ticker):
+        return self.current[self.ticker_loc[ticker]]
+
+    def get_cross_section(self, label):
+        return self.current[:, self.column_loc[label]]
+
+    def get_cursor_value(self, ticker, label):
+        return self.current[self.ticker_loc[ticker], self.column_loc[label]]
+
+    def get_benchmark_closes(self):
+        return dict(self.benchmark_close)
+
+    def is_halted(self, ticker):
+        # no trade before the first price of a ticker
+        return np.isnan(self.current[self.ticker_loc[ticker],
+                                     self.column_loc['close']])
+
+
+class EventBacktest(object):
+    """Event-driven backtest over feeds of different frequencies.
+
+    The events are kept in a priority queue ordered by (timestamp,
+    priority, sequence), see MARKET, SIGNAL, ORDER and FILL. The queue
+    holds the next market event of each feed only, so the feeds are merged
+    lazily. At each timestamp:
+        MARKET  updates the data handler with a row of a feed.
+        SIGNAL  is queued once, after the market events. The triggered
+                resting orders are filled, and the strategy is asked for a
+                signal.
+        ORDER   executes a signal with the order handler.
+        FILL    updates the positions with an execution.
+    The positions are recorded when the clock moves on to the next
+    timestamp, see simulate_trading for when they are marked to market.
+    The data handler keeps the latest values of each ticker, so a slow feed
+    is carried forward between its events.
+
+    Only the timestamps at which a traded ticker has a market event are 
+    bars: they are recorded and the strategy is asked for a signal. An 
+    event of a benchmark only, e.g. a daily close at midnight, updates its
+    close for the next bar, so that the record has one row per bar of the
+    tickers, as `periods` of the performance assumes.
+
+    Parameters
+    ----------
+    feeds : list
+        Each feed has a `ticker`, its `fields` and iterates over
+        (timestamp in nanoseconds, 1d array of the fields) in time order,
+        e.g. FrameFeed. A ticker may have several feeds, and a benchmark
+        feed must have a 'close' field.
+    tickers : list of string
+    benchmarks : list of string
+    initial_capital : float
+    position_handler_cls : (Class)
+    order_handler_cls : (Class)
+    strategy_cls : (Class)
+    performance_cls : (Class)
+    strategy_params : dictionary, optional
+    periods : float, optional
+        Number of bars of the traded tickers in a year, PERIODS of 
+        5-minute bars by default.
+
+    Attributes
+    ----------
+    data_handler : EventDataHandler
+    events : int
+        Number of events processed.
+    transactions : int
+    account_record : DataFrame
+        The cash and total along the recorded timestamps.
+    position_record : DataFrame
+        The positions of each ticker, built on demand.
+    """
+    def __init__(self, feeds, tickers, benchmarks, initial_capital,
+                 position_handler_cls, order_handler_cls, strategy_cls,
+                 performance_cls, strategy_params=None, periods=PERIODS):
+        fields = []
+        for feed in feeds:
+            fields.extend(f for f in feed.fields if f not in fields)
+        self.feeds = feeds
+        self.data_handler = EventDataHandler(tickers, benchmarks, fields)
+        self.position_handler = position_handler_cls(self.data_handler,
+                                                     initial_capital)
+        self.order_handler = order_handler_cls(self.data_handler,
+                                               self.position_handler)
+        self.strategy = strategy_cls(self.data_handler, self.position_handler,
+                                     **(strategy_params or {}))
+        self.performance_cls = performance_cls
+        self.periods = periods
+        self.queue = []
+        self.sequence = itertools.count()
+        self.events = 0
+        self.transactions = 0
+
+    @property
+    def position_record(self):
+        return self.position_handler.position_record
+
+    def put(self, timestamp, priority, payload=None):
+        """Queue an event.
+        """
+        heapq.heappush(self.queue, (timestamp, priority, next(self.sequence),
+                                    payload))
+
+    def mark_to_market(self):
+        """Mark the positions to market at the timestamps passed since they
+        were last marked, all at once, and record them.
+
+        Returns
+        -------
+        bool : whether the total fell below zero, the record then ends at
+            the first such timestamp.
+        """
+        if not self.unmarked_times:
+            return False
+        total = self.position_handler.mark_block(
+            np.array(self.unmarked_times, dtype='datetime64[ns]'),
+            np.array(self.unmarked_close))
+        del self.unmarked_times[:], self.unmarked_close[:]
+        below = np.flatnonzero(total < 0)
+        if len(below):
+            self.position_handler.ledger.length -= len(total) - below[0] - 1
+            return True
+        return False
+
+    def simulate_trading(self, output=True, block_size=4096):
+        """Executes the backtest.
+
+        The positions only change with the fills, so they are marked to
+        market lazily: the close prices of the timestamps without any order
+        are kept, and marked all at once, see mark_to_market, before the
+        next order is executed or every `block_size` timestamps. The
+        strategy sees the quantities and the cash of the positions, their
+        market values may be behind.
+
+        Parameters
+        ----------
+        output : bool
+        block_size : int
+            Maximal number of timestamps marked to market at once.
+        """
+        dh = self.data_handler
+        ph = self.position_handler
+        oh = self.order_handler
+        generate_signal = self.strategy.generate_signal
+        column_loc = dh.column_loc
+        close = dh.get_cross_section('close')
+        queue = self.queue
+        sequence = self.sequence
+        heappush, heappop = heapq.heappush, heapq.heappop
+        self.unmarked_times, self.unmarked_close = [], []
+
+        for feed in self.feeds:
+            rows = iter(feed)
+            benchmark = feed.ticker if feed.ticker in dh.benchmark_close \
+                else None
+            columns = [column_loc[f] for f in feed.fields]
+            if columns == list(range(columns[0], columns[0] + len(columns))):
+                # a slice is much faster to assign than a list
+                columns = slice(columns[0], columns[0] + len(columns))
+            state = (dh.ticker_loc.get(feed.ticker), columns, benchmark,
+                     feed.fields.index('close') if benchmark else None, rows)
+            first = next(rows, None)
+            if first is not None:
+                self.put(first[0], MARKET, (state, first[1]))
+
+        clock = None
+        traded = False  # whether a traded ticker has an event at the clock
+        marked = False  # whether the positions are marked at the clock
+        bankrupt = False
+        while queue:
+            timestamp, priority, _, payload = heappop(queue)
+            self.events += 1
+            if timestamp != clock:
+                if traded:
+                    dh.record()
+                    if marked:
+                        ph.add_one_record()
+                        bankrupt = ph.current_position['total'] < 0
+                    else:
+                        self.unmarked_times.append(clock)
+                        self.unmarked_close.append(close.copy())
+                        if len(self.unmarked_times) >= block_size:
+                            bankrupt = self.mark_to_market()
+                    if bankrupt:
+                        break
+                    dh.cursor += 1
+                clock = dh.datetime = timestamp
+                traded = marked = False
+
+            if priority == MARKET:
+                state, values = payload
+                i, columns, benchmark, close_pos, rows = state
+                dh.update(i, columns, values, benchmark, close_pos)
+                following = next(rows, None)
+                if following is not None:
+                    heappush(queue, (following[0], MARKET, next(sequence),
+                                     (state, following[1])))
+                if i is not None and not traded:
+                    heappush(queue, (timestamp, SIGNAL, next(sequence), None))
+                    traded = True
+
+            elif priority == SIGNAL:
+                triggered = oh.triggered_orders()
+                if triggered:
+                    bankrupt = self.mark_to_market()
+                    if bankrupt:
+                        break
+                    ph.update_from_market(close)
+                    marked = True
+                for signal, prices in triggered:
+                    ph.update_from_order(oh.execute_order(signal, prices))
+                    self.transactions += 1
+                signal = generate_signal()
+                if signal:
+                    heappush(queue, (timestamp, ORDER, next(sequence), signal))
+
+            elif priority == ORDER:
+                if not marked:
+                    bankrupt = self.mark_to_market()
+                    if bankrupt:
+                        break
+                    ph.update_from_market(close)
+                    marked = True
+                execute = oh.execute_order(payload)
+                if execute:
+                    heappush(queue, (timestamp, FILL, next(sequence), execute))
+
+            elif priority == FILL:
+                ph.update_from_order(payload)
+                self.transactions += 1
+
+        if not bankrupt and traded:
+            dh.record()
+            if marked:
+                ph.add_one_record()
+            else:
+                self.unmarked_times.append(clock)
+                self.unmarked_close.append(close.copy())
+        if not bankrupt:
+            bankrupt = self.mark_to_market()
+        if bankrupt:
+            print('Bankruptcy! GAME OVER')
+        dh.finish(ph.ledger.length)
+        print('Number of events: %d' % self.events)
+        print('Number of transactions: %d' % self.transactions)
+        print('\n')
+
+        self.account_record = ph.account_record
+        self.performance = self.performance_cls(dh, self.account_record,
+                                                self.periods,
+                                                self.strategy.name)
+        if output:
+            self.performance.output_performance()
+
+
+if __name__ == '__main__':
+    from cache import default_cache
+    from features import default_pipeline
+    from order_handler import OrderHandler
+    from performance import Performance
+    from position_handler import PositionHandler
+    from strategy.sma_cross import MovingAverage
+
+    # 5-minute bars of the stock with the moving averages, and the daily
+    # closes of the benchmark, each labeled at the end of its day so that it
+    # is only known from the next day on
+    path = u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'
+    bars = default_pipeline.frame(path % '600030.SH',
+                                  MovingAverage.features())
+    daily = default_cache.read_csv(path % '000300.SH').resample(
+        'D', label='right', closed='left').last()
+    b = EventBacktest([FrameFeed('600030.SH', bars),
+                       FrameFeed('000300.SH', daily.dropna(), ['close'])],
+                      ['600030.SH'], ['000300.SH'], 100., PositionHandler,
+                      OrderHandler, MovingAverage, Performance)
+    b.simulate_trading()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:58:15 2026
+
+@author: Yibing
+"""
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cache import default_cache
+
+
+class Indicator(namedtuple('Indicator', ['name', 'kind', 'column', 'params'])):
+    """Declares one feature column required by a strategy.
+
+    Parameters
+    ----------
+    name : string
+        Label of the feature in the data handler, e.g. 'MA-short'.
+    kind : string
+        Key of the function in INDICATORS, e.g. 'sma'.
+    column : string
+        Input column, e.g. 'close'.
+    **params
+        Keyword arguments of the function, e.g. window=10.
+
+    Example
+    -------
+    Indicator('MA-short', 'sma', 'close', window=10)
+    """
+    __slots__ = ()
+
+    def __new__(cls, name, kind, column, **params):
+        return super(Indicator, cls).__new__(cls, name, kind, column,
+                                             tuple(sorted(params.items())))
+
+
+def sma(values, window):
+    return pd.Series(values).rolling(window=window).mean().values
+
+
+def ema(values, span):
+    return pd.Series(values).ewm(span=span, adjust=False).mean().values
+
+
+def rolling_std(values, window):
+    return pd.Series(values).rolling(window=window).std().values
+
+
+def rolling_max(values, window):
+    return pd.Series(values).rolling(window=window).max().values
+
+
+def rolling_min(values, window):
+    return pd.Series(values).rolling(window=window).min().values
+
+
+def pct_change(values, periods=1):
+    out = np.empty(len(values))
+    out[:periods] = np.nan
+    out[periods:] = values[periods:] / values[:-periods] - 1.
+    return out
+
+
+# Each function maps a 1d input array to an output of the same length
+INDICATORS = {'sma': sma,
+              'ema': ema,
+              'std': rolling_std,
+              'max': rolling_max,
+              'min': rolling_min,
+              'pct_change': pct_change}
+
+
+class FeatureCache(object):
+    """Least recently used cache of arrays within a memory budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The least recently used items are evicted once the arrays held
+        take more than this.
+    """
+    def __init__(self, max_bytes=512 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        value = self._items.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self._items:
+            self.nbytes -= self._nbytes(self._items.pop(key))
+        self._items[key] = value
+        self.nbytes += self._nbytes(value)
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            _, evicted = self._items.popitem(last=False)
+            self.nbytes -= self._nbytes(evicted)
+
+    def clear(self):
+        self._items.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def _nbytes(value):
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True).sum())
+        return value.nbytes
+
+
+class FeaturePipeline(object):
+    """Computes the declared indicators of the market data files in memory.
+
+    The parsed files and every (file, indicator, input column, params)
+    result are kept in one FeatureCache. A sweep over many parameter
+    combinations therefore parses each file once and computes each
+    distinct indicator once.
+
+    Parameters
+    ----------
+    cache : FeatureCache
+    source_cache : ColumnarCache
+        Used to load the parsed csv files.
+    """
+    def __init__(self, cache=None, source_cache=default_cache):
+        self.cache = cache if cache is not None else FeatureCache()
+        self.source_cache = source_cache
+
+    def source_key(self, path):
+        # a changed file gets a new key, the stale items age out of the LRU
+        st = self.source_cache.stat(path)
+        return path, st['size'], st['mtime']
+
+    def load(self, path):
+        """Parsed csv file, from memory if it was loaded before.
+        """
+        key = ('source',) + self.source_key(path)
+        frame = self.cache.get(key)
+        if frame is None:
+            frame = self.source_cache.read_csv(path)
+            self.cache.put(key, frame)
+        return frame
+
+    def compute(self, key, frame, indicator):
+        """Values of one indicator of `frame`, identified by `key`.
+        """
+        item = (key, indicator.kind, indicator.column, indicator.params)
+        values = self.cache.get(item)
+        if values is None:
+            func = INDICATORS[indicator.kind]
+            values = func(np.asarray(frame[indicator.column],
+                                     dtype=np.float64),
+                          **dict(indicator.params))
+            self.cache.put(item, values)
+        return values
+
+    def frame(self, path, indicators, dropna=True):
+        """The parsed csv file with one extra column per indicator.
+
+        Parameters
+        ----------
+        path : string
+        indicators : list of Indicator
+        dropna : bool
+            Drop the first rows where an indicator is not defined yet.
+        """
+        return self.add_features(self.source_key(path), self.load(path),
+                                 indicators, dropna)
+
+    def add_features(self, key, source, indicators, dropna=True):
+        """Copy of `source` with one extra column per indicator.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the content of `source` in the cache.
+        source : DataFrame
+        indicators : list of Indicator
+        dropna : bool
+        """
+        frame = source.copy()
+        for i in indicators:
+            frame[i.name] = self.compute(key, source, i)
+        return frame.dropna() if dropna else frame
+
+
+default_pipeline = FeaturePipeline()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:28:27 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+from batch_performance import skew_kurtosis
+from drawdown import underwater
+from performance import Performance
+
+
+def combine_moments(a, b):
+    """Moments of the union of two samples, from the moments of each.
+
+    Parameters
+    ----------
+    a, b : tuple
+        (count, mean, M2, M3, M4), where Mk is the sum of the k-th powers of
+        the deviations from the mean.
+
+    Returns
+    -------
+    tuple : (count, mean, M2, M3, M4)
+
+    Notice
+    ------
+    The pairwise update of Chan et al. and Pebay, a single value x is the
+    sample (1, x, 0, 0, 0), which gives Welford's update.
+    """
+    na, mean_a, m2a, m3a, m4a = a
+    nb, mean_b, m2b, m3b, m4b = b
+    if na == 0:
+        return b
+    if nb == 0:
+        return a
+    n = na + nb
+    delta = mean_b - mean_a
+    delta_n = delta / n
+    cross = delta * delta_n * na * nb
+    mean = mean_a + delta_n * nb
+    m2 = m2a + m2b + cross
+    m3 = m3a + m3b + cross * delta_n * (na - nb) + \
+        3. * delta_n * (na * m2b - nb * m2a)
+    m4 = m4a + m4b + cross * delta_n * delta_n * (na * na - na * nb + nb * nb) + \
+        6. * delta_n * delta_n * (na * na * m2b + nb * nb * m2a) + \
+        4. * delta_n * (na * m3b - nb * m3a)
+    return n, mean, m2, m3, m4
+
+
+def sample_moments(values):
+    """(count, mean, M2, M3, M4) of a 1d array.
+    """
+    n = len(values)
+    if n == 0:
+        return 0, 0., 0., 0., 0.
+    mean = values.mean()
+    dev = values - mean
+    dev2 = dev * dev
+    return n, mean, dev2.sum(), (dev2 * dev).sum(), (dev2 * dev2).sum()
+
+
+class OnlinePerformance(object):
+    """The figures of Performance, updated bar by bar with the total of the
+    account, in constant memory.
+
+    The returns are summarized by their central moments, the sum of the
+    squares of the negative ones and the high-water mark of the total, so
+    that the figures can be read at any time during a backtest and no
+    history needs to be kept.
+
+    Parameters
+    ----------
+    periods : int
+    name : string
+        Unique identifier of the strategy
+    benchmarks : list of string
+        The excess returns over each of them are summarized as well.
+
+    Attributes
+    ----------
+    bars : int
+        Number of bars seen.
+    total : float
+        Latest total.
+    peak : float
+        High-water mark of the total.
+    drawdown : float
+        Current drawdown, (total - peak) / peak.
+    max_drawdown : float
+    moments : tuple
+        (count, mean, M2, M3, M4) of the returns, see combine_moments.
+    excess_moments : dictionary, (benchmark: tuple)
+        (count, mean, M2, M3, M4) of the excess returns over each benchmark.
+
+    Notice
+    ------
+    As in Performance, the return of the first bar is zero. A bar where a
+    benchmark or its previous close is missing has no excess return.
+    """
+    metrics = Performance.metrics
+
+    def __init__(self, periods, name, benchmarks=()):
+        self.periods = periods
+        self.strategy_name = name
+        self.bars = 0
+        self.first = np.nan
+        self.total = np.nan
+        self.peak = np.nan
+        self.drawdown = 0.
+        self.max_drawdown = 0.
+        self.moments = sample_moments(np.zeros(0))
+        self.downside = 0.
+        self.benchmark_first = dict((b, np.nan) for b in benchmarks)
+        self.benchmark_close = dict((b, np.nan) for b in benchmarks)
+        self.excess_moments = dict((b, self.moments) for b in benchmarks)
+
+    def update(self, total, benchmark_closes=None):
+        """Add one bar.
+
+        Parameters
+        ----------
+        total : float
+        benchmark_closes : dictionary, (benchmark: float), optional
+        """
+        r = 0. if self.bars == 0 else total / self.total - 1.
+        if self.bars == 0:
+            self.first = self.peak = total
+        self.bars += 1
+        self.total = total
+        self.moments = combine_moments(self.moments, (1, r, 0., 0., 0.))
+        if r < 0:
+            self.downside += r * r
+        self.peak = max(self.peak, total)
+        self.drawdown = (total - self.peak) / self.peak
+        self.max_drawdown = min(self.max_drawdown, self.drawdown)
+
+        for b, close in (benchmark_closes or {}).items():
+            previous = self.benchmark_close[b]
+            if self.bars == 1:
+                excess = 0.
+                self.benchmark_first[b] = close
+            else:
+                excess = r - (close / previous - 1.)
+            if not np.isnan(excess):
+                self.excess_moments[b] = combine_moments(
+                    self.excess_moments[b], (1, excess, 0., 0., 0.))
+            if not np.isnan(close):
+                self.benchmark_close[b] = close
+
+    def update_block(self, totals, benchmark_closes=None):
+        """Add several bars at once, the same as calling update for each.
+
+        Parameters
+        ----------
+        totals : 1d array
+        benchmark_closes : dictionary, (benchmark: 1d array), optional
+        """
+        totals = np.asarray(totals, dtype=np.float64)
+        if len(totals) == 0:
+            return
+        first_bar = self.bars == 0
+        if first_bar:
+            self.first = self.peak = totals[0]
+        previous = np.r_[totals[0] if first_bar else self.total, totals[:-1]]
+        returns = totals / previous - 1.
+        self.bars += len(totals)
+        self.total = totals[-1]
+        self.moments = combine_moments(self.moments, sample_moments(returns))
+        negative = np.minimum(returns, 0.)
+        self.downside += np.dot(negative, negative)
+        down = underwater(np.r_[self.peak, totals])[1:]
+        self.peak = max(self.peak, totals.max())
+        self.drawdown = down[-1]
+        self.max_drawdown = min(self.max_drawdown, down.min())
+
+        for b, closes in (benchmark_closes or {}).items():
+            closes = np.asarray(closes, dtype=np.float64)
+            last = pd.Series(np.r_[self.benchmark_close[b], closes]).ffill()
+            last = last.values
+            excess = returns - (closes / last[:-1] - 1.)
+            if first_bar:
+                excess[0] = 0.
+                self.benchmark_first[b] = closes[0]
+            excess = excess[~np.isnan(excess)]
+            self.excess_moments[b] = combine_moments(self.excess_moments[b],
+                                                     sample_moments(excess))
+            self.benchmark_close[b] = last[-1]
+
+    @staticmethod
+    def annual_figures(moments, periods):
+        """Annual mean, annual volatility, unbiased skewness and kurtosis
+        of a sample summarized by its moments.
+        """
+        n, mean, m2, m3, m4 = moments
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma = np.sqrt(np.float64(m2) / (n - 1.)) * np.sqrt(periods)
+            skewness, kurt = skew_kurtosis(n, np.float64(m2) / n, 
+                                           np.float64(m3) / n,
+                                           np.float64(m4) / n)
+        return mean * periods, sigma, skewness, kurt
+
+    def create_performance(self):
+        """
+        Returns
+        -------
+        tuple : the figures of Performance.create_performance, so far.
+        """
+        n = self.bars
+        mean, sigma, skewness, kurt = self.annual_figures(self.moments,
+                                                          self.periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            strategy_return = ((self.total / self.first) ** (1. / n) - 1) * \
+                self.periods
+            downside = np.sqrt(self.downside / n) * np.sqrt(self.periods)
+            sharpe = mean / sigma
+            sortino = mean / downside
+        RaR = mean - 2.33 * sigma
+        return strategy_return, sigma, downside, self.max_drawdown, sharpe, \
+            sortino, RaR, skewness, kurt
+
+    def excess_performance(self):
+        """Annual mean and volatility of the excess returns over each
+        benchmark, their ratio, and the return of the benchmark so far.
+
+        Returns
+        -------
+        DataFrame : one row per benchmark.
+        """
+        rows = []
+        for b, moments in self.excess_moments.items():
+            mean, sigma, _, _ = self.annual_figures(moments, self.periods)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows.append((mean, sigma, mean / sigma,
+                             self.benchmark_close[b] / self.benchmark_first[b]
+                             - 1.))
+        return pd.DataFrame(rows, index=list(self.excess_moments.keys()),
+                            columns=['excess_return', 'tracking_error',
+                                     'information_ratio', 'benchmark_return'])
+
+    def output_performance(self):
+        """Prints the summary statistics so far.
+        """
+        print('%s after %d bars:' % (self.strategy_name, self.bars))
+        Performance.print_figures(self.create_performance())
+        if self.excess_moments:
+            print(self.excess_performance())
@@ -4,42 +4,380 @@ Created on Wed Sep 16 12:39:47 2015
 
 @author: Yibing
 """
+import heapq
+from collections import namedtuple
+
+import numpy as np
+
+from position_handler import trade
+
+
+# A resting order of one ticker. side is +1 to buy and -1 to sell, weight is
+# the weight against cash of an 'ENTER' or the ratio of an 'EXIT'.
+PendingOrder = namedtuple('PendingOrder', ['seq', 'ticker', 'act', 'weight',
+                                           'side', 'limit', 'stop'])
+
+
+class SortedOrders(object):
+    """Orders sorted by a price, ties in the order they were placed.
+
+    The orders are kept in a min-heap and a max-heap. An order triggered 
+    from one end is popped from one heap and only marked as removed in the
+    other, where it is dropped once it reaches the top. Placing an order 
+    costs O(log n) and triggering k orders O(k log n). The heaps are 
+    rebuilt once the removed orders outnumber the others.
+    """
+    def __init__(self):
+        self.low = []  # (price, seq, order)
+        self.high = []  # (-price, seq, order)
+        self.removed = set()  # seq of the orders left in one heap
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, price, order):
+        heapq.heappush(self.low, (price, order.seq, order))
+        heapq.heappush(self.high, (-price, order.seq, order))
+        self.count += 1
+
+    def _top(self, heap):
+        while heap and heap[0][1] in self.removed:
+            self.removed.discard(heapq.heappop(heap)[1])
+        return heap[0] if heap else None
+
+    def _pop(self, heap, bound):
+        orders = []
+        while True:
+            top = self._top(heap)
+            if top is None or top[0] > bound:
+                break
+            heapq.heappop(heap)
+            self.removed.add(top[1])
+            orders.append(top[2])
+        self.count -= len(orders)
+        if len(self.removed) > self.count:
+            self.low = [e for e in self.low if e[1] not in self.removed]
+            self.high = [e for e in self.high if e[1] not in self.removed]
+            heapq.heapify(self.low)
+            heapq.heapify(self.high)
+            self.removed.clear()
+        return orders
+
+    def pop_below(self, price):
+        """Remove and return the orders at price or lower.
+        """
+        return self._pop(self.low, price)
+
+    def pop_above(self, price):
+        """Remove and return the orders at price or higher.
+        """
+        return self._pop(self.high, -price)
+
+    def lowest(self):
+        return self._top(self.low)[0]
+
+    def highest(self):
+        return -self._top(self.high)[0]
+
+
+class PendingOrderBook(object):
+    """Resting limit, stop and stop-limit orders, checked against the open,
+    high and low of each bar.
+
+    The orders of each ticker are kept in four price-sorted books, so that
+    the triggered ones are always at one end of a book:
+        buy limits trigger if low <= limit, the highest limits first
+        sell limits trigger if high >= limit, the lowest limits first
+        buy stops trigger if high >= stop, the lowest stops first
+        sell stops trigger if low <= stop, the highest stops first
+    A stop-limit is kept with the stops. Once triggered, it is filled if
+    its trigger price does not go beyond the limit, otherwise it rests as
+    a limit order from the next bar on.
+
+    A limit is filled at the limit, or at the open if the bar gaps beyond
+    it. A stop is filled at the stop, or at the open if the bar gaps
+    beyond it.
+    """
+    def __init__(self):
+        self.books = {}
+        self.seq = 0
+
+    def __len__(self):
+        return sum(len(b) for books in self.books.values() for b in
+                   books.values())
+
+    def _books(self, ticker):
+        if ticker not in self.books:
+            self.books[ticker] = dict((k, SortedOrders()) for k in
+                ('buy_limit', 'sell_limit', 'buy_stop', 'sell_stop'))
+        return self.books[ticker]
+
+    def add(self, ticker, act, weight, side, limit=None, stop=None):
+        """Place an order, a limit order if only limit is given, a stop
+        order if only stop is given and a stop-limit if both are.
+        """
+        assert limit is not None or stop is not None, 'a price is required'
+        order = PendingOrder(self.seq, ticker, act, weight, side, limit, stop)
+        self.seq += 1
+        direction = 'buy' if side > 0 else 'sell'
+        if stop is None:
+            self._books(ticker)[direction + '_limit'].add(limit, order)
+        else:
+            self._books(ticker)[direction + '_stop'].add(stop, order)
+        return order
+
+    def cancel(self, ticker):
+        """Cancel all the orders of a ticker.
+        """
+        self.books.pop(ticker, None)
+
+    @property
+    def tickers(self):
+        return [t for t, books in self.books.items() if
+                any(len(b) for b in books.values())]
+
+    def trigger(self, ticker, open_, high, low):
+        """Remove the orders of a ticker triggered in a bar.
+
+        Returns
+        -------
+        list of tuple : (order, fill price), in the order they were placed.
+        """
+        books = self.books.get(ticker)
+        if books is None:
+            return []
+        fills = []
+        for o in books['buy_limit'].pop_above(low):
+            fills.append((o, min(o.limit, open_)))
+        for o in books['sell_limit'].pop_below(high):
+            fills.append((o, max(o.limit, open_)))
+        for o in books['buy_stop'].pop_below(high):
+            price = max(o.stop, open_)
+            if o.limit is None or price <= o.limit:
+                fills.append((o, price))
+            else:
+                books['buy_limit'].add(o.limit, o)
+        for o in books['sell_stop'].pop_above(low):
+            price = min(o.stop, open_)
+            if o.limit is None or price >= o.limit:
+                fills.append((o, price))
+            else:
+                books['sell_limit'].add(o.limit, o)
+        fills.sort(key=lambda f: f[0].seq)
+        return fills
+
+    def first_trigger(self, high, low, ticker_loc):
+        """Position of the first bar of a block in which an order of the
+        book is triggered, or None.
+
+        Parameters
+        ----------
+        high, low : 2d array
+            (bars, tickers) prices of the block.
+        ticker_loc : dictionary, (ticker: int)
+            Column of each ticker.
+        """
+        triggered = np.zeros(len(high), dtype=bool)
+        for t in self.tickers:
+            books = self.books[t]
+            j = ticker_loc[t]
+            if len(books['buy_limit']):
+                triggered |= low[:, j] <= books['buy_limit'].highest()
+            if len(books['sell_limit']):
+                triggered |= high[:, j] >= books['sell_limit'].lowest()
+            if len(books['buy_stop']):
+                triggered |= high[:, j] >= books['buy_stop'].lowest()
+            if len(books['sell_stop']):
+                triggered |= low[:, j] <= books['sell_stop'].highest()
+        bars = np.flatnonzero(triggered)
+        return bars[0] if len(bars) else None
+
 
 class OrderHandler(object):
     """Receive signals and infer the number of shares to trade based on 
     relative weights.    
+
+    Attributes
+    ----------
+    pending : PendingOrderBook
+        The resting limit, stop and stop-limit orders.
     """
     def __init__(self, data_handler, position_handler):
         self.data_handler = data_handler
         self.position_handler = position_handler
+        self.pending = PendingOrderBook()
+
+    def place_orders(self, signal, quantities=None):
+        """Put the orders of a signal with a limit or a stop price into the
+        pending order book.
+        
+        Parameters
+        ----------
+        signal : tuple. (act, dictionary, order)
+        quantities : dictionary, optional
+            Number of shares held of some tickers, e.g. after the fills of
+            a batch not yet applied to the position handler. The current 
+            position by default.
+        """
+        act, weights, order = signal
+        limits = order.get('limit', {})
+        stops = order.get('stop', {})
+        quantities = quantities or {}
+        for k, w in weights.items():
+            if act == 'ENTER':
+                side = 1 if w > 0 else -1
+            else:
+                # an exit trades against the position held
+                held = quantities.get(k,
+                    self.position_handler.current_position[k][0])
+                side = -1 if held > 0 else 1
+            self.pending.add(k, act, w, side, limits.get(k), stops.get(k))
+
+    def triggered_orders(self):
+        """The pending orders triggered at the current bar, as signals.
 
-    def execute_order(self, signal):
+        Returns
+        -------
+        list of tuple : (signal, prices), to be executed in order with
+            execute_order(signal, prices).
+        """
+        if not self.pending.books:
+            return []
+        triggered = []
+        for k in self.pending.tickers:
+            if self.data_handler.is_halted(k):
+                continue
+            fills = self.pending.trigger(k, self.bar_price(k, 'open'),
+                                         self.bar_price(k, 'high'),
+                                         self.bar_price(k, 'low'))
+            triggered.extend(fills)
+        triggered.sort(key=lambda f: f[0].seq)
+        return [((o.act, {o.ticker: o.weight}), {o.ticker: price}) for
+                o, price in triggered]
+
+    def bar_price(self, ticker, label):
+        """A price of the current bar, the close for the data without it.
+        """
+        try:
+            return self.data_handler.get_value(ticker, label)
+        except KeyError:
+            return self.data_handler.get_value(ticker, 'close')
+
+    def execute_batch(self, signals):
+        """Net a list of signals of the same bar into one fill per ticker.
+        
+        The signals are sized in turn as if executed one after the other at
+        the transaction price: an 'ENTER' against the cash left by the 
+        previous signals, an 'EXIT' as a ratio of the position left by 
+        them. Only the net quantity of each ticker is traded, and the 
+        transaction cost is charged on it once.
+        
+        Parameters
+        ----------
+        signals : list of tuple
+            Signals as for execute_order. Those with a limit or a stop price
+            and the cancellations are handled after the netting, in their 
+            order, so that a resting 'EXIT' trades against the position 
+            left by the batch, e.g. the stop-loss of an entry of the same 
+            batch sells what the entry buys.
+            
+        Returns
+        -------
+        execute : tuple. ('BATCH', transaction_cost, quantities, prices)
+            quantities has ticker and net number of shares, + to buy. None
+            if nothing is traded.
+        """
+        transaction_rate = 0.0015
+        current = self.position_handler.current_position
+        cash = current['cash']
+        qty, cost, prices = {}, {}, {}
+        deferred = []
+        for signal in signals:
+            if signal[0] == 'CANCEL' or (len(signal) > 2 and signal[2]):
+                deferred.append(signal)
+                continue
+            weights = dict((k, w) for k, w in signal[1].items() if 
+                not self.data_handler.is_halted(k))
+            cash_before = cash
+            for k, w in weights.items():
+                if k not in qty:
+                    qty[k], cost[k] = current[k][0], current[k][2]
+                    prices[k] = self.data_handler.get_value(k, 'transaction')
+                if signal[0] == 'ENTER':
+                    # the weights of one signal share the same cash
+                    q = cash_before * w / ((1.+transaction_rate)*prices[k])
+                else:
+                    q = -qty[k] * w
+                new_qty, new_cost, flow = trade(qty[k], cost[k], q, prices[k])
+                qty[k], cost[k] = float(new_qty), float(new_cost)
+                cash += float(flow)
+        
+        for signal in deferred:
+            if signal[0] == 'CANCEL':
+                self.execute_order(signal)
+            else:
+                self.place_orders(signal, qty)
+                
+        qtys = dict((k, q - current[k][0]) for k, q in qty.items() if
+                    q != current[k][0])
+        if not qtys:
+            return None
+        transaction_cost = sum(abs(q*prices[k]) for k, q in qtys.items()) * \
+            transaction_rate
+        return 'BATCH', transaction_cost, qtys, prices
+        
+    def execute_order(self, signal, prices=None):
         """Receive the relative weight and calculate the exact number of 
         shares to buy or sell. 
         
         Parameters
         ---------
-        signal : tuple. (act, dictionary)
-            act could be 'ENTER' or 'EXIT'
+        signal : tuple. (act, dictionary) or (act, dictionary, order)
+            act could be 'ENTER', 'EXIT' or 'CANCEL'
             For 'ENTER', dictionary has ticker and its weights against cash, where
             weight could be +/-, which stands for buy/sell.
             For 'EXIT', dictionary has ticker and exit ratio, which stands for
             how much position would be closed out.
+            For 'CANCEL', the pending orders of the tickers of the dictionary
+            are cancelled.
+            order is a dictionary with the prices of a resting order,
+            {'limit': {ticker: price}} for a limit order,
+            {'stop': {ticker: price}} for a stop order, or both for a
+            stop-limit order. Such orders are put into the pending order book
+            instead of being executed at once.
+        prices : dictionary, optional
+            Fill price of each ticker, the transaction price by default.
             
         Returns
         -------
-        execute : tuple. (type, transaction_cost, dictionary)
+        execute : tuple. (type, transaction_cost, dictionary[, prices])
             type could be 'ENTER' and 'EXIT'
             transaction_cost is the total transaction cost.
             dictionary has ticker and weights 
+            prices is the fill price of each ticker, if given.
+            None if nothing is executed now.
             
         Notice
         ------
         Transaction cost is calculated only when entering the market.
+        No order is executed for a ticker which is halted at the moment.
+        A list of signals is netted into one batch, see execute_batch.
         """
+        if isinstance(signal, list):
+            return self.execute_batch(signal)
+        if signal[0] == 'CANCEL':
+            for k in signal[1]:
+                self.pending.cancel(k)
+            return None
+        if len(signal) > 2 and signal[2]:
+            self.place_orders(signal)
+            return None
+
         transaction_rate = 0.0015
         transaction_cost = 0. # cumulative
-        weights = signal[1]
+        weights = dict((k, w) for k, w in signal[1].items() if 
+            not self.data_handler.is_halted(k))
         qtys = {}
         
         if signal[0] == 'ENTER':
@@ -47,7 +385,8 @@ class OrderHandler(object):
             # to each stock and : qty = alloc / traded_price
             for k, w in weights.items():
                 # get the price 
-                price = self.data_handler.get_cursor_value(k, 'transaction')
+                price = self.data_handler.get_value(k, 'transaction') if \
+                    prices is None else prices[k]
                 cash = self.position_handler.current_position['cash']
                 alloc = cash * w
                 qtys[k] = alloc / ((1.+transaction_rate)*price)
@@ -56,8 +395,49 @@ class OrderHandler(object):
         elif signal[0] == 'EXIT':
             for k, w in weights.items():
                 qtys[k] = w
-                price = self.data_handler.get_cursor_value(k, 'transaction')
+                price = self.data_handler.get_value(k, 'transaction') if \
+                    prices is None else prices[k]
                 qty = self.position_handler.current_position[k][0]
                 transaction_cost += abs(qty*price)*transaction_rate
                 
+        if prices is not None:
+            return signal[0], transaction_cost, qtys, prices
         return signal[0], transaction_cost, qtys
+
+
+class QuoteOrderHandler(OrderHandler):
+    """OrderHandler which fills the orders at the quotes instead of the 
+    transaction price: buys at the 'ask' and sells at the 'bid' of the data
+    handler, e.g. of a tick_store.TickReplayFeed. A ticker without a quote 
+    is filled at the transaction price.
+    
+    Notice
+    ------
+    The resting orders are still filled at their limit or stop price, and
+    the signals netted by execute_batch at the transaction price.
+    """
+    def quote_prices(self, signal):
+        """Fill price of each ticker of a signal, by the side it trades.
+        """
+        act, weights = signal[0], signal[1]
+        prices = {}
+        for k, w in weights.items():
+            if self.data_handler.is_halted(k):
+                continue
+            if act == 'ENTER':
+                buy = w > 0
+            else:
+                # an exit trades against the position held
+                buy = self.position_handler.current_position[k][0] < 0
+            price = self.data_handler.get_value(k, 'ask' if buy else 'bid')
+            if not price > 0:
+                price = self.data_handler.get_value(k, 'transaction')
+            prices[k] = price
+        return prices
+        
+    def execute_order(self, signal, prices=None):
+        if prices is None and not isinstance(signal, list) and \
+                signal[0] in ('ENTER', 'EXIT') and \
+                not (len(signal) > 2 and signal[2]):
+            prices = self.quote_prices(signal)
+        return OrderHandler.execute_order(self, signal, prices)
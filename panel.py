@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:54:41 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+
+class Panel(object):
+    """Aligned market data of many tickers in one (time, ticker, field)
+    array, so that the cross-ticker operations are array slices instead of
+    loops over dictionaries.
+
+    Parameters
+    ----------
+    values : 3d array
+        (time, ticker, field) float values, nan where a ticker has no bar.
+    mask : 2d array of bool
+        (time, ticker), True where a ticker has a bar.
+    index : pandas DatetimeIndex
+        Union of the indices of all tickers.
+    tickers : list of string
+    fields : list of string
+
+    Attributes
+    ----------
+    ticker_loc : Dictionary, (ticker: int)
+    field_loc : Dictionary, (field: int)
+
+    Notice
+    ------
+    Every accessor returns a view into `values`, nothing is copied. The
+    array is C-ordered, so the row of one ticker at one time is contiguous
+    and the cross section of one field is strided.
+    """
+    def __init__(self, values, mask, index, tickers, fields):
+        assert values.shape == (len(index), len(tickers), len(fields))
+        assert mask.shape == values.shape[:2]
+        self.values = values
+        self.mask = mask
+        self.index = index
+        self.tickers = list(tickers)
+        self.fields = list(fields)
+        self.ticker_loc = dict((s, i) for i, s in enumerate(self.tickers))
+        self.field_loc = dict((c, j) for j, c in enumerate(self.fields))
+
+    @classmethod
+    def from_frames(cls, frames, tickers=None, fields=None):
+        """Align a dictionary of DataFrames on the union of their indices.
+
+        Parameters
+        ----------
+        frames : Dictionary, (ticker: pd.DataFrame)
+        tickers : list of string, optional
+            Order of the tickers, all keys of `frames` by default.
+        fields : list of string, optional
+            Columns to keep, the numeric columns of the first frame by
+            default.
+        """
+        if tickers is None:
+            tickers = list(frames.keys())
+        first = frames[tickers[0]]
+        if fields is None:
+            fields = [c for c in first.columns if
+                np.issubdtype(first[c].dtype, np.number)]
+
+        index = first.index
+        for s in tickers[1:]:
+            if not frames[s].index.equals(index):
+                index = index.union(frames[s].index)
+
+        values = np.empty((len(index), len(tickers), len(fields)))
+        values.fill(np.nan)
+        mask = np.zeros((len(index), len(tickers)), dtype=bool)
+        for i, s in enumerate(tickers):
+            loc = index.get_indexer(frames[s].index)
+            values[loc, i, :] = frames[s][fields].values
+            mask[loc, i] = True
+        return cls(values, mask, index, tickers, fields)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def cross_section(self, field, cursor):
+        """Values of one field of all tickers at one time.
+        """
+        return self.values[cursor, :, self.field_loc[field]]
+
+    def row(self, ticker, cursor):
+        """All fields of one ticker at one time.
+        """
+        return self.values[cursor, self.ticker_loc[ticker]]
+
+    def series(self, ticker, field):
+        """One field of one ticker along the whole index.
+        """
+        return self.values[:, self.ticker_loc[ticker], self.field_loc[field]]
+
+    def field(self, field):
+        """(time, ticker) values of one field.
+        """
+        return self.values[:, :, self.field_loc[field]]
+
+    def window(self, ticker, field, cursor, n):
+        """Last `n` values of one field of one ticker up to and including
+        the cursor, fewer at the beginning of the index.
+        """
+        start = max(cursor - n + 1, 0)
+        return self.values[start:cursor + 1, self.ticker_loc[ticker],
+                           self.field_loc[field]]
+
+    def valid(self, cursor):
+        """Which tickers have a bar at the cursor.
+        """
+        return self.mask[cursor]
+
+    def to_frame(self, ticker):
+        """DataFrame of one ticker, a view of `values` where possible.
+        """
+        return pd.DataFrame(self.values[:, self.ticker_loc[ticker]],
+                            index=self.index, columns=self.fields)
+
+
+class JoinedPanel(object):
+    """The fields of several panels along the same index and tickers, e.g.
+    the market data shared by many runs and the features of one run, with
+    the accessors of Panel and without copying any of them.
+
+    Parameters
+    ----------
+    panels : list of Panel
+        The index, tickers and mask are those of the first one.
+
+    Notice
+    ------
+    The fields of one ticker at one time are no longer contiguous, so row()
+    returns a copy. The other accessors return views.
+    """
+    def __init__(self, panels):
+        first = panels[0]
+        for p in panels[1:]:
+            assert p.values.shape[:2] == first.values.shape[:2]
+            assert p.tickers == first.tickers
+        self.panels = list(panels)
+        self.mask = first.mask
+        self.index = first.index
+        self.tickers = first.tickers
+        self.ticker_loc = first.ticker_loc
+        self.fields = [f for p in self.panels for f in p.fields]
+        self.field_loc = dict((c, j) for j, c in enumerate(self.fields))
+        assert len(self.field_loc) == len(self.fields), 'fields not unique'
+        self._owner = dict((f, p) for p in self.panels for f in p.fields)
+
+    @property
+    def shape(self):
+        return self.mask.shape + (len(self.fields),)
+
+    def cross_section(self, field, cursor):
+        return self._owner[field].cross_section(field, cursor)
+
+    def row(self, ticker, cursor):
+        return np.concatenate([p.row(ticker, cursor) for p in self.panels])
+
+    def series(self, ticker, field):
+        return self._owner[field].series(ticker, field)
+
+    def field(self, field):
+        return self._owner[field].field(field)
+
+    def window(self, ticker, field, cursor, n):
+        return self._owner[field].window(ticker, field, cursor, n)
+
+    def valid(self, cursor):
+        return self.mask[cursor]
+
+    def to_frame(self, ticker):
+        return pd.concat([p.to_frame(ticker) for p in self.panels], axis=1)
@@ -7,10 +7,11 @@ Created on Wed Sep 16 12:42:17 2015
 # performance.py
 import numpy as np
 import pandas as pd
-from scipy.stats import skew, kurtosis
-import matplotlib.pyplot as plt
 import pprint
 
+import drawdown
+import rolling
+
 class Performance(object):
     """Visualize cumulative returns, as well as performance indicators
     
@@ -40,18 +41,30 @@ class Performance(object):
       (returns - benchmark_returns)
     periods : int
     strategy_name : string
+    metrics : tuple of string
+        Names of the figures returned by create_performance, in order.
+        
+    Notice
+    ------
+    The static methods take the returns along `axis` of an array, so that 
+    they also compute a figure of many series at once, see 
+    batch_performance.BatchPerformance.
     """
+    metrics = ('return', 'volatility', 'downside_deviation', 'max_drawdown',
+               'sharpe', 'sortino', 'risk_adjusted_return', 'skewness',
+               'kurtosis')
+    
     def __init__(self, data_handler, position_record, periods, name):
         
         self.returns = position_record['total'].pct_change()
-        self.returns[0] = 0.
+        self.returns.iloc[0] = 0.
         self.cumulative_returns = (1. + self.returns).cumprod()
         
         self.benchmark_returns = dict((b, s.pct_change()) for b, s in 
             data_handler.benchmarks.items())
         # pct_change() will cause the first element to be nan, set it to zero
         for b in self.benchmark_returns.keys():
-            self.benchmark_returns[b][0] = 0.
+            self.benchmark_returns[b].iloc[0] = 0.
         
         self.benchmark_cumulative_returns = dict((b, (1. + s).cumprod()) for 
             b, s in self.benchmark_returns.items())
@@ -66,78 +79,93 @@ class Performance(object):
         self.strategy_name = name
         
     @staticmethod
-    def mean_return(returns, periods):
+    def mean_return(returns, periods, axis=0):
         """Annual return
         """
-        return np.mean(returns)*periods
+        return np.mean(returns, axis=axis)*periods
 
     @staticmethod        
-    def volatility(returns, periods):
+    def volatility(returns, periods, axis=0):
         """annual volatility
         """
-        return np.std(returns, ddof=1)*np.sqrt(periods)
+        return np.std(returns, ddof=1, axis=axis)*np.sqrt(periods)
 
     @staticmethod        
-    def sharpe_ratio(returns, risk_free, periods):
+    def sharpe_ratio(returns, risk_free, periods, axis=0):
         """Create the Sharpe ratio for the strategy, based on a zero
         benchmark.
         """
-        return (Performance.mean_return(returns, periods) - risk_free) / \
-            Performance.volatility(returns, periods)
+        return (Performance.mean_return(returns, periods, axis) - risk_free) / \
+            Performance.volatility(returns, periods, axis)
 
     @staticmethod    
-    def downside_deviation(returns, periods):
+    def downside_deviation(returns, periods, axis=0):
         """
         sqrt(sum{r_t < 0}(r_t^2 / T))
         """
-        neg_returns = returns[returns < 0]
-        return np.sqrt(sum([r ** 2 for r in neg_returns]) / len(returns)) * \
-            np.sqrt(periods)
+        neg_returns = np.minimum(returns, 0.)
+        return np.sqrt(np.sum(neg_returns ** 2, axis=axis) / 
+                       np.shape(returns)[axis]) * np.sqrt(periods)
 
     @staticmethod       
-    def sortino_ratio(returns, periods):
+    def sortino_ratio(returns, periods, axis=0):
         """
         """
-        return Performance.mean_return(returns, periods) / \
-            Performance.downside_deviation(returns, periods)
+        return Performance.mean_return(returns, periods, axis) / \
+            Performance.downside_deviation(returns, periods, axis)
 
     @staticmethod    
-    def risk_adjusted_return(returns, periods):
+    def risk_adjusted_return(returns, periods, axis=0):
         """
         mean - lambda * volatility. Useful for negative returns.
         2.33 - 99%
         """
-        return Performance.mean_return(returns, periods) - \
-            2.33*Performance.volatility(returns, periods)
+        return Performance.mean_return(returns, periods, axis) - \
+            2.33*Performance.volatility(returns, periods, axis)
 
     @staticmethod    
-    def max_drawdown(cumulative_returns):
+    def max_drawdown(cumulative_returns, axis=0):
         """Maximal loss before a new peak is formed.
         
         Returns
         -------
         (through_value - peak_value) / peak_value
         """
-        peak_idx, low_idx = 0, 0
-        max_drawdown = 0.
-        for i, cr in enumerate(cumulative_returns):
-            if cr < cumulative_returns.iloc[low_idx]:
-                low_idx = i
-            elif cr > cumulative_returns.iloc[peak_idx]:
-                prev_peak = cumulative_returns.iloc[peak_idx]
-                prev_low = cumulative_returns.iloc[low_idx]
-                if (prev_low - prev_peak) / prev_peak < max_drawdown:
-                    max_drawdown = (prev_low - prev_peak) / prev_peak
-                # reset peak and low index
-                peak_idx, low_idx = i, i
-            # if no peak is formed again, calculate max drawdown
-            prev_peak = cumulative_returns.iloc[peak_idx]
-            prev_low = cumulative_returns.iloc[low_idx]
-            if (prev_low - prev_peak) / prev_peak < max_drawdown:
-                max_drawdown = (prev_low - prev_peak) / prev_peak
-                
-        return max_drawdown
-                
+        return drawdown.max_drawdown(cumulative_returns, axis)
+        
+    def drawdowns(self):
+        """Every drawdown of the strategy with its peak, trough, recovery 
+        and duration, largest first, see drawdown.drawdown_table.
+        """
+        return drawdown.drawdown_table(self.cumulative_returns)
+        
+    def rolling_metrics(self, windows):
+        """Rolling volatility, Sharpe ratio and downside deviation, and the 
+        rolling beta, alpha, correlation and tracking error against each 
+        benchmark, for one or several window lengths, see 
+        rolling.rolling_metrics.
+        """
+        return rolling.rolling_metrics(self.returns, self.periods, windows,
+                                       self.benchmark_returns)
+            
+    @staticmethod
+    def print_figures(figures):
+        """Prints the figures of create_performance as summary statistics.
+        """
+        strategy_return, strategy_sigma, downside, max_down, sharpe, sortino, RaR, \
+           skewness, kurt = figures
+        stats = [
+                ("Strategy Return: %0.2f%%" % (strategy_return * 100,)),
+                ("Strategy Volatility: %0.4f" % strategy_sigma),
+                ("Risk Adjusted Return: %0.2f%%" % (RaR * 100.,)),
+                ("Downside Deviation: %0.4f" % downside),
+                ("Maximal Drawdown: %0.2f%%" % (max_down * 100.,)),
+                ("Sharpe Ratio: %0.2f" % (sharpe,)),
+                ("Sortino Ratio: %0.2f" % (sortino,)),
+                ("Skewness: %0.4f" % (skewness,)),
+                ("Kurtosis: %0.4f" % (kurt,))
+                ]
+        pprint.pprint(stats)
             
     def create_performance(self):
         """
@@ -153,6 +181,8 @@ class Performance(object):
         sharpe = Performance.sharpe_ratio(self.returns, 0.0, self.periods)
         sortino = Performance.sortino_ratio(self.returns, self.periods)
         RaR = Performance.risk_adjusted_return(self.returns, self.periods)
+        # imported on demand, only the figures need scipy
+        from scipy.stats import skew, kurtosis
         skewness = skew(self.returns, bias=False)
         kurt = kurtosis(self.returns, bias=False)
         
@@ -160,48 +190,26 @@ class Performance(object):
             skewness, kurt
         
         
-    def output_performance(self):
+    def output_performance(self, plot=True, filename=None, max_points=2000):
         """Creates a list of summary statistics for the portfolio.
+        
+        Parameters
+        ----------
+        plot : bool
+            Whether to plot the cumulative and excess returns. matplotlib
+            is only imported to plot.
+        filename : string, optional
+            Render the plot to this file instead of showing it, without 
+            any window, e.g. on a server.
+        max_points : int
+            The series are downsampled to about this number of points, see
+            reporting.plot_performance.
         """
         print("Creating summary stats...")    
-        strategy_return, strategy_sigma, downside, max_down, sharpe, sortino, RaR, \
-           skewness, kurt = self.create_performance()
-            
-        stats = [
-                ("Strategy Return: %0.2f%%" % (strategy_return * 100,)),
-                ("Strategy Volatility: %0.4f" % strategy_sigma),
-                ("Risk Adjusted Return: %0.2f%%" % (RaR * 100.,)),
-                ("Downside Deviation: %0.4f" % downside),
-                ("Maximal Drawdown: %0.2f%%" % (max_down * 100.,)),
-                ("Sharpe Ratio: %0.2f" % (sharpe,)),
-                ("Sortino Ratio: %0.2f" % (sortino,)),
-                ("Skewness: %0.4f" % (skewness,)),
-                ("Kurtosis: %0.4f" % (kurt,))
-                ]
-        num_of_benchmark = len(self.benchmark_returns)
-        fig, axes = plt.subplots(1 + num_of_benchmark, sharex=True)
-        axes[0].plot(self.cumulative_returns.index, 
-                     self.cumulative_returns, 
-                     label=self.strategy_name)
-        axes[0].set_ylabel('Cumulative Return')
-        axes[0].set_title('Performance against the benchmark')
-        for b, s in self.benchmark_cumulative_returns.items():
-            axes[0].plot(s.index,
-                         s,
-                         label='Benchmark: %s' % b)
-        axes[0].legend(loc='best', bbox_to_anchor=(0.75, 1.02))
-        axes[0].grid(True)
-
-        index = self.returns.index
-        for i, item in enumerate(self.excess_returns.items()):
-            axes[i+1].vlines(index, 0., item[1], color='red', 
-                             label='Excess returns over %s' % item[0])
-            axes[i+1].axhline(y=0., ls='dotted', color='k')
-            axes[i+1].legend(loc='best')
-            axes[i+1].grid(True)
-            
-        fig.subplots_adjust(hspace=0)
-        fig.show()
+        figures = self.create_performance()
+        if plot:
+            from reporting import plot_performance
+            plot_performance(self, filename, max_points)
   
-        pprint.pprint(stats)
+        Performance.print_figures(figures)
         
@@ -4,8 +4,151 @@ Created on Thu Feb 18 10:43:36 2016
 
 @author: Yibing
 """
-from copy import deepcopy, copy
 import numpy as np
+import pandas as pd
+
+
+def trade(qty, cost, dq, price):
+    """Quantity, cost and cash flow of positions after trading dq shares of
+    each at price. Works on arrays, elementwise.
+    
+    A trade against the position closes out a fraction of it, which gives
+    back that fraction of its realizable value. The shares beyond the 
+    position open a new one in the other direction, which costs their 
+    value in cash, for long and short positions alike.
+    
+    Returns
+    -------
+    tuple : (new quantity, new cost, cash flow)
+    """
+    qty, cost, dq, price = [np.asarray(a, dtype=np.float64) for a in 
+                            (qty, cost, dq, price)]
+    new_qty = qty + dq
+    flat = np.round(new_qty, 3) == 0.
+    closing = (qty != 0.) & (np.sign(dq) == -np.sign(qty))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(closing, np.minimum(np.abs(dq / qty), 1.), 0.)
+    fraction = np.where(flat & (qty != 0.), 1., fraction)
+    opened = np.where(closing, np.maximum(np.abs(dq) - np.abs(qty), 0.), 
+                      np.abs(dq))
+    opened = np.where(flat, 0., opened)
+    
+    signed_cost = np.where(qty > 0., cost, -cost)
+    realizable = cost + (qty * price - signed_cost)
+    cash = fraction * realizable - opened * price
+    new_cost = cost * (1. - fraction) + opened * price
+    return np.where(flat, 0., new_qty), np.where(flat, 0., new_cost), cash
+
+
+class PositionLedger(object):
+    """History of the positions in preallocated arrays, one row per bar.
+    
+    Parameters
+    ----------
+    tickers : list
+    capacity : int
+        Number of bars allocated at first, doubled whenever it is full.
+    history : bool
+        Whether the whole history is kept. If not, the bars recorded so
+        far are dropped by discard(), but the last one.
+    
+    Attributes
+    ----------
+    positions : 3d array
+        (bars, tickers, 7), the 1d array of each ticker at each bar.
+    cash : 1d array
+    total : 1d array
+    datetimes : 1d array of datetime64
+    length : int
+        Number of bars held.
+    offset : int
+        Number of bars discarded before the first one held.
+    """
+    def __init__(self, tickers, capacity=1024, history=True):
+        self.tickers = tickers
+        self.history = history
+        self.offset = 0
+        capacity = max(int(capacity), 1)
+        self.positions = np.zeros((capacity, len(tickers), 7))
+        self.cash = np.zeros(capacity)
+        self.total = np.zeros(capacity)
+        self.datetimes = np.zeros(capacity, dtype='datetime64[ns]')
+        self.length = 0
+        
+    def _grow(self):
+        capacity = 2 * len(self.cash)
+        for name in ('positions', 'cash', 'total', 'datetimes'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+            
+    def record(self, datetime, positions, cash, total):
+        """Append one bar, positions is (tickers, 7) array-like.
+        """
+        if self.length == len(self.cash):
+            self._grow()
+        i = self.length
+        self.positions[i] = positions
+        self.cash[i] = cash
+        self.total[i] = total
+        self.datetimes[i] = pd.Timestamp(datetime).to_datetime64()
+        self.length += 1
+        
+    def record_block(self, datetimes, positions, cash, total):
+        """Append several bars at once, positions is (bars, tickers, 7) and
+        cash a float or a 1d array.
+        """
+        n = len(total)
+        while self.length + n > len(self.cash):
+            self._grow()
+        i = self.length
+        self.positions[i:i + n] = positions
+        self.cash[i:i + n] = cash
+        self.total[i:i + n] = total
+        self.datetimes[i:i + n] = np.asarray(datetimes, dtype='datetime64[ns]')
+        self.length += n
+        
+    def discard(self):
+        """Drop the bars held but the last one, if the history is not kept.
+        """
+        if self.history or self.length < 2:
+            return
+        last = self.length - 1
+        for name in ('positions', 'cash', 'total', 'datetimes'):
+            values = getattr(self, name)
+            values[0] = values[last]
+        self.offset += last
+        self.length = 1
+        
+    def account_frame(self):
+        """The cash and the total as a DataFrame indexed by datetime, built
+        from the ledger arrays without any object per bar.
+        """
+        n = self.length
+        index = pd.DatetimeIndex(self.datetimes[:n], name='datetime')
+        return pd.DataFrame({'cash': self.cash[:n], 'total': self.total[:n]},
+                            index=index, columns=['cash', 'total'])
+        
+    def to_frame(self):
+        """The history as a DataFrame indexed by datetime, with the cash, 
+        the total and one column of 1d arrays per ticker. The arrays are 
+        views into the ledger.
+        
+        Notice
+        ------
+        It holds one object per bar and ticker, build it only to look at 
+        the positions. account_frame() is enough for the performance.
+        """
+        n = self.length
+        data = dict((s, list(self.positions[:n, j])) for j, s in 
+            enumerate(self.tickers))
+        data['cash'] = self.cash[:n]
+        data['total'] = self.total[:n]
+        index = pd.DatetimeIndex(self.datetimes[:n], name='datetime')
+        return pd.DataFrame(data, index=index, 
+                            columns=list(self.tickers) + ['cash', 'total'])
+    
 
 class PositionHandler(object):
     """PositionHandler object handles account balances and support both
@@ -21,8 +164,17 @@ class PositionHandler(object):
     Attributes
     ----------
     tickers : list
+    positions : 2d array
+        (tickers, 7), the 1d arrays of current_position stacked in the 
+        order of tickers.
+    ledger : PositionLedger
+        The current_position at each time, in preallocated arrays.
+    position_record : DataFrame
+        The ledger as a DataFrame, built on demand.
+    account_record : DataFrame
+        The cash and total of the ledger, built on demand.
     historical_position : list of dictionaries
-        The elements are current_posisions at each time.
+        The elements are current_posisions at each time, built on demand.
     current_position : dictionary
         The first type of items are (tickers, 1d array).
         ------------------------------------------------
@@ -40,55 +192,111 @@ class PositionHandler(object):
         ----------------------------------------
         The second type of items are {'cash':float} and {'total': float}, where
         total = cash + sum(realizable_value)                                     
+        The 1d arrays are the rows of `positions`, update them in place.
     """
     def __init__(self, data_handler, initial_capital): 
         self.data_handler = data_handler
         self.initial_capital = initial_capital
         self.tickers = self.data_handler.tickers
-        self.historical_position = []
+        # the length of a stream is unknown, the ledger grows as needed
+        self.ledger = PositionLedger(self.tickers, 
+                                     getattr(self.data_handler, 'length', 1024))
         
-        self.current_position = dict((s, np.zeros(7)) for s in self.tickers)
+        self.positions = np.zeros((len(self.tickers), 7))
+        self.current_position = dict((s, self.positions[j]) for j, s in 
+            enumerate(self.tickers))
         self.current_position['cash'] = self.initial_capital
         self.current_position['total'] = self.initial_capital
       
-    def update_from_market(self):
+    def update_from_market(self, close=None):
         """Every time new market data is looped over, 
         the portfolio must update the current market value of all the 
         positions held. This function is executed before any transactions.
-        """ 
-        # Update position for new market bar
-        total_realizable_value = 0.
         
-        for s in self.tickers:
-            if self.current_position[s][0] == 0.:
-                continue;
-            
-            price = self.data_handler.get_cursor_value(s, 'close')
-            # Approximation to the real value
-            mkt_value = self.current_position[s][0] * price
-            self.current_position[s][1] = price
-            self.current_position[s][4] = mkt_value
-            
-            # different methods to cal pnl between long and short sale
-            # long position: 
-            # unrealized_pnl = mkt_value - cost
-            # short position:
-            # unrealized_pnl = mkt_value + cost
-            d = -1. if self.current_position[s][0] > 0. else 1.
+        Parameters
+        ----------
+        close : 1d array, optional
+            Close prices of the tickers at the cursor, if already looked up.
+        """ 
+        # Update position for new market bar, only the rows held
+        held = np.flatnonzero(self.positions[:, 0])
+        if len(held) == 0:
+            self.current_position['total'] = self.current_position['cash']
+            return
             
-            self.current_position[s][5] = mkt_value + \
-                d*self.current_position[s][2]
-                    
-            # realizable_value = cost + unrealized
-            self.current_position[s][6] = \
-                self.current_position[s][2] + self.current_position[s][5]
-                
-            # calculate total realizable value    
-            total_realizable_value += self.current_position[s][6]
-                        
-        # end loop, calculate balance
+        rows = self.positions[held]
+        qty = rows[:, 0]
+        if close is None:
+            close = self.data_handler.get_cross_section('close')
+        price = close[held]
+        # Approximation to the real value
+        rows[:, 1] = price
+        rows[:, 4] = qty * price
+        
+        # different methods to cal pnl between long and short sale
+        # long position: 
+        # unrealized_pnl = mkt_value - cost
+        # short position:
+        # unrealized_pnl = mkt_value + cost
+        d = np.where(qty > 0., -1., 1.)
+        rows[:, 5] = rows[:, 4] + d*rows[:, 2]
+        
+        # realizable_value = cost + unrealized
+        rows[:, 6] = rows[:, 2] + rows[:, 5]
+        self.positions[held] = rows
+        
+        # calculate balance
         self.current_position['total'] = self.current_position['cash'] + \
-            + total_realizable_value
+            rows[:, 6].sum()
+                 
+    def update_from_market_block(self, start, end):
+        """update_from_market followed by add_one_record for each of the 
+        bars [start, end) of the data handler's panel, when no order is 
+        executed in between. The positions are constant, so the bars are 
+        marked to market all at once.
+        
+        Returns
+        -------
+        1d array : total of each bar.
+        """
+        return self.mark_block(self.data_handler.index[start:end],
+                               self.data_handler.panel.field('close')[start:end])
+        
+    def mark_block(self, datetimes, close):
+        """Mark the constant positions to market at several bars and record
+        them, see update_from_market_block.
+        
+        Parameters
+        ----------
+        datetimes : array-like of datetime64
+        close : 2d array
+            (bars, tickers) close prices.
+            
+        Returns
+        -------
+        1d array : total of each bar.
+        """
+        n = len(close)
+        cash = self.current_position['cash']
+        positions = np.repeat(self.positions[np.newaxis], n, axis=0)
+        held = np.flatnonzero(self.positions[:, 0])
+        if len(held):
+            rows = positions[:, held]
+            qty = rows[:, :, 0]
+            rows[:, :, 1] = close[:, held]
+            rows[:, :, 4] = qty * rows[:, :, 1]
+            d = np.where(qty > 0., -1., 1.)
+            rows[:, :, 5] = rows[:, :, 4] + d*rows[:, :, 2]
+            rows[:, :, 6] = rows[:, :, 2] + rows[:, :, 5]
+            positions[:, held] = rows
+            total = cash + rows[:, :, 6].sum(axis=1)
+        else:
+            total = np.full(n, cash)
+        
+        self.ledger.record_block(datetimes, positions, cash, total)
+        self.positions[:] = positions[-1]
+        self.current_position['total'] = total[-1]
+        return total
                  
     def update_from_order(self, execute):
         """Takes a signal object and updates the holdings matrix to
@@ -96,13 +304,19 @@ class PositionHandler(object):
         
         Parameters
         ----------
-        execute : tuple. (transaction_cost, dictionary)
+        execute : tuple. (type, transaction_cost, dictionary[, prices])
             transaction_cost is the total transaction cost
             dictionary has ticker and quantity
+            prices has the fill price of each ticker, e.g. of a limit 
+            order, the transaction price of the bar by default
         """
         signal_type = execute[0]
         transaction_cost = execute[1]
         qtys = execute[2]
+        prices = execute[3] if len(execute) > 3 else None
+        if signal_type == 'BATCH':
+            self.apply_fills(qtys, prices, transaction_cost)
+            return
         total_realizable_value = 0.
         for k, q in qtys.items():
             if q == 0.:
@@ -113,11 +327,21 @@ class PositionHandler(object):
             signed_old_cost = old_cost if old_qty > 0 else -old_cost
             
             new_qty = old_qty + q
-            price = self.data_handler.get_cursor_value(k, 'transaction')
+            if prices is None:
+                price = self.data_handler.get_value(k, 'transaction')
+            else:
+                price = prices[k]
+                if old_qty != 0.:
+                    # the position is closed out at the fill price
+                    position = self.current_position[k]
+                    position[1] = price
+                    position[4] = old_qty * price
+                    position[5] = position[4] - signed_old_cost
+                    position[6] = position[2] + position[5]
             if round(new_qty, 3) == 0.:
                 # set all values to zero
                 self.current_position['cash'] += self.current_position[k][6]
-                self.current_position[k] = np.zeros(7)
+                self.current_position[k][:] = 0.
                 
             elif signal_type == 'ENTER':
                 new_cost = abs(signed_old_cost + q*price)
@@ -146,12 +370,71 @@ class PositionHandler(object):
         self.current_position['total'] = self.current_position['cash'] + \
             total_realizable_value
     
+    def apply_fills(self, qtys, prices, transaction_cost):
+        """Trade the net quantity of each ticker at its price, all at once,
+        and charge the transaction cost of the whole batch.
+        
+        Parameters
+        ----------
+        qtys : dictionary
+            Ticker and number of shares, + to buy and - to sell.
+        prices : dictionary
+            Ticker and fill price.
+        transaction_cost : float
+        
+        Notice
+        ------
+        Unlike update_from_order, the total counts the realizable value of
+        all the positions held.
+        """
+        loc = dict((s, j) for j, s in enumerate(self.tickers))
+        idx = np.array([loc[k] for k in qtys], dtype=int)
+        dq = np.array([qtys[k] for k in qtys], dtype=np.float64)
+        price = np.array([prices[k] for k in qtys], dtype=np.float64)
+        
+        rows = self.positions[idx]
+        new_qty, new_cost, cash = trade(rows[:, 0], rows[:, 2], dq, price)
+        held = new_qty != 0.
+        rows[:, 0] = new_qty
+        rows[:, 1] = np.where(held, price, 0.)
+        rows[:, 2] = new_cost
+        rows[:, 3] = np.where(held, new_cost / np.where(held, new_qty, 1.), 0.)
+        rows[:, 4] = price * new_qty
+        d = np.where(new_qty > 0., -1., 1.)
+        rows[:, 5] = np.where(held, rows[:, 4] + d*new_cost, 0.)
+        rows[:, 6] = new_cost + rows[:, 5]
+        self.positions[idx] = rows
+        
+        self.current_position['cash'] += cash.sum() - transaction_cost
+        self.current_position['total'] = self.current_position['cash'] + \
+            self.positions[:, 6].sum()
+        
     def add_one_record(self):
         # Add a new record to all positions
-        datetime = deepcopy(self.data_handler.index[self.data_handler.cursor])
-        new_position = deepcopy(self.current_position)
-        new_position['datetime'] =  datetime # Current time
+        self.ledger.record(self.data_handler.get_datetime(),
+                           self.positions,
+                           self.current_position['cash'],
+                           self.current_position['total'])
+        
+    @property
+    def position_record(self):
+        return self.ledger.to_frame()
+        
+    @property
+    def account_record(self):
+        return self.ledger.account_frame()
         
-        self.historical_position.append(new_position)
+    @property
+    def historical_position(self):
+        n = self.ledger.length
+        records = []
+        for i in range(n):
+            record = dict((s, self.ledger.positions[i, j].copy()) for j, s in 
+                enumerate(self.tickers))
+            record['cash'] = self.ledger.cash[i]
+            record['total'] = self.ledger.total[i]
+            record['datetime'] = pd.Timestamp(self.ledger.datetimes[i])
+            records.append(record)
+        return records
         
                
\ No newline at end of file
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:30:40 2026
+
+@author: Yibing
+"""
+import numpy as np
+
+
+def _positions(x):
+    # the x values as floats, datetimes in nanoseconds
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').view(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, max_points):
+    """Largest-Triangle-Three-Buckets downsampling of a line, which keeps
+    its visual shape.
+
+    The first and last points are kept, the others are split into
+    max_points - 2 buckets and the point of each bucket kept is the one
+    forming the largest triangle with the point kept in the previous
+    bucket and the average of the next bucket.
+
+    Parameters
+    ----------
+    x, y : 1d arrays
+        x may hold datetimes.
+    max_points : int
+
+    Returns
+    -------
+    1d array of int : sorted positions of the points kept.
+    """
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    xs, ys = _positions(x), np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    # average of every bucket, and of the last point as the bucket after
+    # the last one
+    sums_x = np.add.reduceat(xs[:n - 1], edges[:-1])
+    sums_y = np.add.reduceat(ys[:n - 1], edges[:-1])
+    sizes = np.diff(edges)
+    avg_x = np.r_[sums_x / sizes, xs[-1]]
+    avg_y = np.r_[sums_y / sizes, ys[-1]]
+
+    kept = np.empty(max_points, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for k in range(max_points - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # twice the area of the triangles, the sign does not matter
+        area = np.abs((xs[a] - avg_x[k + 1]) * (ys[lo:hi] - ys[a]) -
+                      (xs[a] - xs[lo:hi]) * (avg_y[k + 1] - ys[a]))
+        a = lo + int(np.argmax(area))
+        kept[k + 1] = a
+    return kept
+
+
+def minmax_buckets(y, buckets):
+    """Lowest and highest value of consecutive buckets of equal size, which
+    keeps the spikes of a series.
+
+    Parameters
+    ----------
+    y : 1d array
+    buckets : int
+
+    Returns
+    -------
+    tuple of 1d arrays : (first position, low, high) of each bucket.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if buckets >= n:
+        return np.arange(n), y, y
+    size = -(-n // buckets)
+    padded = np.full(size * (-(-n // size)), np.nan)
+    padded[:n] = y
+    padded = padded.reshape(-1, size)
+    with np.errstate(invalid='ignore'):
+        low = np.nanmin(padded, axis=1)
+        high = np.nanmax(padded, axis=1)
+    return np.arange(0, n, size), low, high
+
+
+def minmax(x, y, max_points):
+    """Min-max downsampling of a line, the lowest and the highest point of
+    each bucket are kept in their order.
+
+    Returns
+    -------
+    1d array of int : sorted positions of the points kept.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    size = -(-n // max(max_points // 2, 1))
+    padded = np.full(size * (-(-n // size)), np.nan)
+    padded[:n] = y
+    padded = padded.reshape(-1, size)
+    offsets = np.arange(0, len(padded) * size, size)
+    low = np.nanargmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    high = np.nanargmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    kept = np.sort(np.column_stack([low, high]), axis=1) + offsets[:, None]
+    return np.unique(np.minimum(kept.ravel(), n - 1))
+
+
+def downsample(x, y, max_points, method='lttb'):
+    """Positions of the points of a line to plot, see lttb and minmax.
+    """
+    if method == 'lttb':
+        return lttb(x, y, max_points)
+    elif method == 'minmax':
+        return minmax(x, y, max_points)
+    raise ValueError('Unknown method %s' % method)
+
+
+def plot_performance(performance, filename=None, max_points=2000,
+                     method='lttb'):
+    """Cumulative returns of the strategy and of the benchmarks, and the
+    excess returns over each benchmark, as Performance.output_performance.
+
+    The lines are downsampled to at most max_points points, and the excess
+    returns are drawn as one bar per bucket, from the lowest to the highest
+    excess return of the bucket.
+
+    Parameters
+    ----------
+    performance : Performance
+    filename : string, optional
+        If given, the figure is rendered to this file with the Agg backend,
+        without pyplot and without any window. Otherwise it is shown.
+    max_points : int
+    method : string
+        'lttb' or 'minmax', see downsample.
+
+    Returns
+    -------
+    matplotlib Figure
+    """
+    if filename is None:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(1 + len(performance.benchmark_returns),
+                                 sharex=True, squeeze=False)
+    else:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(1 + len(performance.benchmark_returns),
+                            sharex=True, squeeze=False)
+    axes = axes[:, 0]
+
+    def line(ax, series, **kwargs):
+        index = series.index.values
+        kept = downsample(index, series.values, max_points, method)
+        ax.plot(index[kept], series.values[kept], **kwargs)
+
+    line(axes[0], performance.cumulative_returns,
+         label=performance.strategy_name)
+    axes[0].set_ylabel('Cumulative Return')
+    axes[0].set_title('Performance against the benchmark')
+    for b, s in performance.benchmark_cumulative_returns.items():
+        line(axes[0], s, label='Benchmark: %s' % b)
+    axes[0].legend(loc='best', bbox_to_anchor=(0.75, 1.02))
+    axes[0].grid(True)
+
+    index = performance.returns.index.values
+    for i, item in enumerate(performance.excess_returns.items()):
+        first, low, high = minmax_buckets(item[1].values, max_points)
+        axes[i+1].vlines(index[first], np.minimum(low, 0.),
+                         np.maximum(high, 0.), color='red',
+                         label='Excess returns over %s' % item[0])
+        axes[i+1].axhline(y=0., ls='dotted', color='k')
+        axes[i+1].legend(loc='best')
+        axes[i+1].grid(True)
+
+    fig.subplots_adjust(hspace=0)
+    if filename is None:
+        fig.show()
+    else:
+        fig.savefig(filename)
+    return fig
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:31:52 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+
+class _Sums(object):
+    """Running sums of a series, or of a pair of series, from which the sums
+    over any window are differences of two entries. The bars where a
+    series is missing are left out of the windows.
+
+    The series are shifted by their mean first, which leaves the variances
+    and covariances unchanged but keeps the running sums small, so that
+    the differences stay accurate on long series.
+    """
+    def __init__(self, x, y=None):
+        valid = ~np.isnan(x)
+        if y is not None:
+            valid &= ~np.isnan(y)
+        self.shift_x = x[valid].mean() if valid.any() else 0.
+        dx = np.where(valid, x - self.shift_x, 0.)
+        self.count = self._running(valid.astype(np.float64))
+        self.x = self._running(dx)
+        self.xx = self._running(dx * dx)
+        self.neg = self._running(np.where(valid, np.minimum(x, 0.), 0.) ** 2)
+        if y is not None:
+            self.shift_y = y[valid].mean() if valid.any() else 0.
+            dy = np.where(valid, y - self.shift_y, 0.)
+            self.y = self._running(dy)
+            self.yy = self._running(dy * dy)
+            self.xy = self._running(dx * dy)
+
+    @staticmethod
+    def _running(values):
+        # a leading zero, so that the sum of [i - w, i) is s[i] - s[i - w]
+        return np.r_[0., np.cumsum(values)]
+
+    def window(self, name, w):
+        """Sum of `name` over the window of w bars ending at each bar, nan
+        for the first w - 1 bars.
+        """
+        s = getattr(self, name)
+        out = np.full(len(s) - 1, np.nan)
+        if w <= len(out):
+            out[w - 1:] = s[w:] - s[:-w]
+        return out
+
+
+def _moments(sums, w):
+    """Count, means and (co)variances over the windows of w bars.
+    """
+    n = sums.window('count', w)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mx = sums.window('x', w) / n
+        var_x = (sums.window('xx', w) - n * mx * mx) / (n - 1.)
+        result = {'n': n, 'mean_x': mx + sums.shift_x,
+                  'var_x': np.maximum(var_x, 0.)}
+        if hasattr(sums, 'y'):
+            my = sums.window('y', w) / n
+            result['mean_y'] = my + sums.shift_y
+            result['var_y'] = np.maximum(
+                (sums.window('yy', w) - n * my * my) / (n - 1.), 0.)
+            result['cov'] = (sums.window('xy', w) - n * mx * my) / (n - 1.)
+    return result
+
+
+def rolling_figures(returns, periods, windows):
+    """Rolling annual volatility, Sharpe ratio and downside deviation of a
+    return series, over several window lengths, in O(n) per window.
+
+    Parameters
+    ----------
+    returns : pd.Series
+    periods : int
+    windows : list of int
+        Number of bars of each window.
+
+    Returns
+    -------
+    DataFrame : indexed as returns, columns (window, figure), a figure is
+        nan until its first full window.
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    sums = _Sums(x)
+    frames = {}
+    for w in windows:
+        m = _moments(sums, w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volatility = np.sqrt(m['var_x']) * np.sqrt(periods)
+            downside = np.sqrt(sums.window('neg', w) / m['n']) * \
+                np.sqrt(periods)
+            sharpe = m['mean_x'] * periods / volatility
+        frames[w] = pd.DataFrame({'volatility': volatility, 'sharpe': sharpe,
+                                  'downside_deviation': downside},
+                                 index=returns.index,
+                                 columns=['volatility', 'sharpe',
+                                          'downside_deviation'])
+    return pd.concat(frames, axis=1, names=['window', 'figure'])
+
+
+def rolling_relative(returns, benchmark_returns, periods, windows):
+    """Rolling beta, annual alpha, correlation and annual tracking error
+    against a benchmark, over several window lengths, in O(n) per window.
+
+    beta = cov(r, b) / var(b), alpha = (mean(r) - beta * mean(b)) * periods
+    and the tracking error is the annual volatility of r - b.
+
+    Parameters
+    ----------
+    returns : pd.Series
+    benchmark_returns : pd.Series
+        Along the same index.
+    periods : int
+    windows : list of int
+
+    Returns
+    -------
+    DataFrame : indexed as returns, columns (window, figure).
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    y = np.asarray(benchmark_returns, dtype=np.float64)
+    sums = _Sums(x, y)
+    frames = {}
+    for w in windows:
+        m = _moments(sums, w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = m['cov'] / m['var_y']
+            alpha = (m['mean_x'] - beta * m['mean_y']) * periods
+            correlation = m['cov'] / np.sqrt(m['var_x'] * m['var_y'])
+            tracking = np.sqrt(np.maximum(m['var_x'] + m['var_y'] -
+                                          2. * m['cov'], 0.)) * \
+                np.sqrt(periods)
+        frames[w] = pd.DataFrame({'beta': beta, 'alpha': alpha,
+                                  'correlation': correlation,
+                                  'tracking_error': tracking},
+                                 index=returns.index,
+                                 columns=['beta', 'alpha', 'correlation',
+                                          'tracking_error'])
+    return pd.concat(frames, axis=1, names=['window', 'figure'])
+
+
+def rolling_metrics(returns, periods, windows, benchmark_returns=None):
+    """The rolling figures of the returns and, against each benchmark, the
+    rolling relative figures, for several window lengths in one call.
+
+    The running sums are computed once per series and shared by all the
+    windows, so the cost is O(n) per window whatever its length.
+
+    Parameters
+    ----------
+    returns : pd.Series
+    periods : int
+    windows : int or list of int
+    benchmark_returns : dictionary, (benchmark: pd.Series), optional
+
+    Returns
+    -------
+    DataFrame : indexed as returns, columns (benchmark, window, figure). The
+        benchmark is empty for the figures of the returns themselves.
+    """
+    if np.isscalar(windows):
+        windows = [windows]
+    windows = [int(w) for w in windows]
+    if any(w < 2 for w in windows):
+        raise ValueError('A window needs at least 2 bars')
+    frames = {'': rolling_figures(returns, periods, windows)}
+    for b, s in (benchmark_returns or {}).items():
+        if not returns.index.equals(s.index):
+            raise ValueError('The returns of benchmark %s are not indexed '
+                             'as the returns' % b)
+        frames[b] = rolling_relative(returns, s, periods, windows)
+    return pd.concat(frames, axis=1, names=['benchmark'])
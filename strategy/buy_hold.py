@@ -4,7 +4,9 @@ Created on Wed Sep 16 12:34:22 2015
 
 @author: Yibing
 """              
-import pandas as pd  
+import numpy as np
+
+from cache import default_cache
 
 class BuyHold(object):
     """Keep initial quantities constant.
@@ -26,6 +28,15 @@ class BuyHold(object):
         self.position_handler = position_handler
         self.name = 'Buy_Hold'
         self.status = 'EMPTY'
+        
+    # generate_block_signals does not look at the data
+    block_fields = []
+    
+    @staticmethod
+    def features():
+        """Buy and hold does not need any feature.
+        """
+        return []
     
     @staticmethod
     def csv_processor(tickers):
@@ -38,12 +49,32 @@ class BuyHold(object):
             Name of raw files.
         """
         for t in tickers:
-            pd.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%t,
-                        index_col=0,
-                        header=0,
-                        parse_dates=True).to_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%t, 
-                                                index_label='datetime')
+            default_cache.derive(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%t,
+                                 'Buy_Hold',
+                                 lambda df: df.copy(),
+                                 output=u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%t)
+
+
+    @staticmethod
+    def target_weights(data_handler):
+        """Target weights of all the bars for the vectorized engine: equal
+        weights from the first bar on.
+        """
+        num = len(data_handler.tickers)
+        return np.full((data_handler.length, num), 1./num)
 
+    def generate_block_signals(self, start, block):
+        """The signals of generate_signal for a block of bars at once: the
+        buy signal at the first bar, and nothing later.
+        
+        Returns
+        -------
+        tuple : (offsets, signals), the positions of the bars with a signal
+            in the block and their signals.
+        """
+        if self.status == 'EMPTY':
+            return [0], [self.generate_signal()]
+        return [], []
 
     def generate_signal(self):
         """Generate buy signal at the beginning and do not do anything later.
@@ -4,8 +4,12 @@ Created on Sat Jul 23 17:14:32 2016
 
 @author: Yibing
 """
+import numpy as np
 import pandas as pd
 
+from cache import default_cache
+from features import Indicator, default_pipeline
+
 class MovingAverage(object):
     """Simple moving average crossover strategy. Buy it if the short-term
     moving average cross the long-term moving average from below. Sell it
@@ -15,6 +19,8 @@ class MovingAverage(object):
     ----------
     data_handler : cls obj
     position_handler : cls obj
+    short_window : int
+    long_window : int
     
     Attributes
     ----------
@@ -23,15 +29,27 @@ class MovingAverage(object):
     status : string
         'EMPTY', 'LONG'  
     """
-    def __init__(self, data_handler, position_handler):
+    def __init__(self, data_handler, position_handler, short_window=10,
+                 long_window=30):
         self.data_handler = data_handler
         self.position_handler = position_handler
+        self.short_window = short_window
+        self.long_window = long_window
         self.name = 'Simple_Moving_Average'
         self.status = 'EMPTY'
+        
+    # fields of the blocks passed to generate_block_signals
+    block_fields = ['MA-short', 'MA-long']
 
+    @staticmethod
+    def features(short_window=10, long_window=30):
+        """Indicators the data handler computes for this strategy.
+        """
+        return [Indicator('MA-short', 'sma', 'close', window=short_window),
+                Indicator('MA-long', 'sma', 'close', window=long_window)]
     
     @staticmethod
-    def csv_processor(tickers):
+    def csv_processor(tickers, short_window=10, long_window=30):
         """Preprocess the raw csv files to obtain necessary features and save
         the new file to the folder
         
@@ -39,18 +57,67 @@ class MovingAverage(object):
         ----------
         tickers : list
             Name of raw files.
+        short_window : int
+        long_window : int
         """
+        features = MovingAverage.features(short_window, long_window)
         for t in tickers:
-            df = pd.read_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%t,
-                             index_col=0,
-                             header=0,
-                             parse_dates=True)
-            df['MA-short'] = df['close'].rolling(window=10).mean()
-            df['MA-long'] = df['close'].rolling(window=30).mean()
-   
-            df.dropna().to_csv(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%t, 
-                                                     index_label='datetime')
+            source = u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%t
+            default_cache.derive(source,
+                                 'Simple_Moving_Average_%d_%d' % (short_window, long_window),
+                                 lambda df: default_pipeline.frame(source, features),
+                                 output=u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\strategy\\data\\%s.csv'%t)
 
+    @staticmethod
+    def target_weights(data_handler):
+        """Target weights of all the bars for the vectorized engine: long
+        from a cross from below until a cross from above, flat otherwise.
+        """
+        assert len(data_handler.tickers) == 1, 'Too many stocks'
+        ticker = data_handler.tickers[0]
+        short = data_handler.arrays[ticker]['MA-short']
+        long_ = data_handler.arrays[ticker]['MA-long']
+        status = np.full(len(short), np.nan)
+        status[short > long_] = 1.
+        status[short < long_] = 0.
+        # keep the previous status while the averages are equal
+        return pd.Series(status).ffill().fillna(0.).values[:, np.newaxis]
+
+    def generate_block_signals(self, start, block):
+        """The signals of generate_signal for a block of bars at once.
+        
+        Parameters
+        ----------
+        start : int
+            Cursor of the first bar of the block.
+        block : dictionary, (label: 2d array)
+            (bars, tickers) values of the block_fields.
+            
+        Returns
+        -------
+        tuple : (offsets, signals), the positions of the bars with a signal
+            in the block and their signals.
+        """
+        assert len(self.data_handler.tickers) == 1, 'Too many stocks'
+        ticker = self.data_handler.tickers[0]
+        short = block['MA-short'][:, 0]
+        long_ = block['MA-long'][:, 0]
+        # the status after each bar, led by the status before the block
+        status = np.full(len(short) + 1, np.nan)
+        status[0] = 1. if self.status == 'LONG' else 0.
+        status[1:][short > long_] = 1.
+        status[1:][short < long_] = 0.
+        status = pd.Series(status).ffill().values
+        
+        offsets = np.flatnonzero(np.diff(status))
+        signals = [('ENTER', {ticker: 1.}) if status[i + 1] == 1. else 
+                   ('EXIT', {ticker: 1.}) for i in offsets]
+        self.status = 'LONG' if status[-1] == 1. else 'EMPTY'
+        entries = offsets[status[offsets + 1] == 1.]
+        if len(entries):
+            self.recent_action_cursor = start + entries[-1]
+        return offsets, signals
+    
     def generate_signal(self):
         """Generate buy signal at the beginning and do not do anything later.
         
@@ -86,8 +153,9 @@ class MovingAverage(object):
         # This is a single stock strategy
         assert len(self.data_handler.tickers) == 1, 'Too many stocks'
         ticker = self.data_handler.tickers[0]
-        short = self.data_handler.get_cursor_value(ticker, 'MA-short')
-        long_ = self.data_handler.get_cursor_value(ticker, 'MA-long')
+        row = self.data_handler.get_cursor_row(ticker)
+        short = row[self.data_handler.column_loc['MA-short']]
+        long_ = row[self.data_handler.column_loc['MA-long']]
         
         if (self.status == 'EMPTY') and short > long_:
             signal = 'ENTER', {ticker: 1.}
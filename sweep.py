@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:03:19 2026
+
+@author: Yibing
+"""
+import os
+import shutil
+import tempfile
+import itertools
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from cache import default_cache
+from data_handler import CSVDataHandler
+from features import default_pipeline
+from order_handler import OrderHandler
+from panel import JoinedPanel, Panel
+from performance import Performance
+from position_handler import PositionHandler
+from vectorized import VectorizedBacktest
+
+
+class SharedMarketData(object):
+    """Market data written once to memory-mapped files, so that every
+    worker process maps the same pages instead of receiving a copy.
+
+    Parameters
+    ----------
+    tickers : list of string
+    benchmarks : list of string
+
+    Attributes
+    ----------
+    directory : string
+        Temporary directory of the .npy files, removed by close().
+    index : pd.DatetimeIndex
+        Union of the indices of the tickers.
+    benchmarks : Dictionary, (ticker: pd.Series)
+        Close price of each benchmark.
+    spec : dictionary
+        What a worker needs to attach to the data, see attach().
+    """
+    def __init__(self, tickers, benchmarks):
+        self.directory = tempfile.mkdtemp(prefix='sweep_')
+        frames = dict((s, default_cache.read_csv(
+            u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%s))
+            for s in tickers)
+        panel = Panel.from_frames(frames, tickers)
+        self.index = panel.index
+        self.benchmarks = {}
+        self._save('values', panel.values)
+        self._save('mask', panel.mask)
+        self._save('index', panel.index.values.astype('datetime64[ns]'))
+        for b in benchmarks:
+            close = default_cache.read_csv(
+                u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\resampled_data\\%s.csv'%b).close
+            self.benchmarks[b] = close
+            self._save('benchmark_%s_values' % b, close.values)
+            self._save('benchmark_%s_index' % b,
+                       close.index.values.astype('datetime64[ns]'))
+        self.spec = {'directory': self.directory,
+                     'tickers': list(tickers),
+                     'benchmarks': list(benchmarks),
+                     'fields': panel.fields}
+
+    def _save(self, name, values):
+        np.save(os.path.join(self.directory, name + '.npy'), values)
+
+    @staticmethod
+    def attach(spec):
+        """Map the files read-only in the current process.
+
+        Returns
+        -------
+        dictionary : the directory, the Panel of the tickers on the mapped
+            values, the rows at which every ticker has every field, and the
+            close of each benchmark.
+        """
+        def load(name):
+            return np.load(os.path.join(spec['directory'], name + '.npy'),
+                           mmap_mode='r')
+        values = load('values')
+        mask = load('mask')
+        panel = Panel(values, mask, pd.DatetimeIndex(load('index'),
+                                                     name='datetime'),
+                      spec['tickers'], spec['fields'])
+        # the rows CSVDataHandler keeps, one scan of the pages per worker
+        complete = mask.all(axis=1)
+        for j in range(len(spec['fields'])):
+            complete &= ~np.isnan(values[:, :, j]).any(axis=1)
+        return {'directory': spec['directory'],
+                'panel': panel,
+                'complete': complete,
+                'benchmarks': dict((b, pd.DataFrame(
+                    {'close': load('benchmark_%s_values' % b)},
+                    index=pd.DatetimeIndex(load('benchmark_%s_index' % b))))
+                    for b in spec['benchmarks'])}
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# the shared data attached in the worker process
+_shared = {}
+
+
+class SharedDataHandler(CSVDataHandler):
+    """CSVDataHandler on the market data attached by the worker.
+
+    The panel of the market data is used as it is mapped, only the feature
+    columns of each parameter combination are allocated. They are computed
+    in the worker and kept in its feature cache.
+
+    As CSVDataHandler, only the rows where every ticker has every field
+    and feature are kept. They are a slice of the mapped values, unless
+    some rows are missing in the middle of the data, which are then copied
+    out.
+    """
+    def __init__(self, tickers, benchmarks, features=None):
+        shared = _shared['panel']
+        assert list(tickers) == shared.tickers, 'tickers not shared'
+        self.tickers = tickers
+        features = features or []
+
+        keep = _shared['complete'].copy()
+        computed = np.empty(shared.mask.shape + (len(features),))
+        computed.fill(np.nan)
+        for i, s in enumerate(tickers):
+            rows = shared.mask[:, i]
+            columns = dict((c, shared.series(s, c)[rows]) for c in 
+                set(f.column for f in features))
+            for j, f in enumerate(features):
+                computed[rows, i, j] = default_pipeline.compute(
+                    (_shared['directory'], s), columns, f)
+        if features:
+            keep &= ~np.isnan(computed).any(axis=(1, 2))
+        start, end = self.window
+        if start is not None:
+            keep[:shared.index.searchsorted(pd.Timestamp(start))] = False
+        if end is not None:
+            keep[shared.index.searchsorted(pd.Timestamp(end)):] = False
+
+        rows = np.flatnonzero(keep)
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            rows = slice(rows[0], rows[-1] + 1)
+        self.index = shared.index[rows]
+        self.panel = JoinedPanel([
+            Panel(shared.values[rows], shared.mask[rows], self.index, 
+                  tickers, shared.fields),
+            Panel(computed[rows], shared.mask[rows], self.index, tickers,
+                  [f.name for f in features])])
+        self.columns = pd.Index(self.panel.fields)
+        self.column_loc = self.panel.field_loc
+        self.arrays = dict((s, dict((c, self.panel.series(s, c)) for c in
+            self.panel.fields)) for s in tickers)
+        print('Successfully loaded %s' % ', '.join(tickers))
+        print('\n')
+
+        self.benchmarks = {}
+        for b in benchmarks:
+            self.benchmarks[b] = self.read_benchmark(b).reindex(
+                index=self.index).close
+            print('Successfully loaded %s' % (b,))
+        print('\n')
+
+        self.cursor = 0
+        self.length = len(self.index)
+
+    def read_benchmark(self, benchmark):
+        return _shared['benchmarks'][benchmark]
+
+    def get_cursor_row(self, ticker):
+        return self.panel.row(ticker, self.cursor)
+
+    def get_cursor_value(self, ticker, label):
+        return self.arrays[ticker][label][self.cursor]
+
+
+def _attach(spec):
+    _shared.update(SharedMarketData.attach(spec))
+
+
+def _run(args):
+    """Run one parameter combination in a worker.
+
+    Parameters
+    ----------
+    args : tuple
+        (tickers, benchmarks, initial_capital, strategy_cls,
+        performance_cls, engine, params, window, keep_total), where window
+        is (start, end) and keep_total whether to return the equity curve.
+    """
+    (tickers, benchmarks, initial_capital, strategy_cls, performance_cls,
+     engine, params, window, keep_total) = args
+    data_handler_cls = SharedDataHandler.windowed(*window)
+    if engine == 'vectorized':
+        b = VectorizedBacktest(tickers, benchmarks, initial_capital,
+                               data_handler_cls, strategy_cls,
+                               performance_cls, params)
+    else:
+        b = Backtest(tickers, benchmarks, initial_capital, data_handler_cls,
+                     PositionHandler, OrderHandler, strategy_cls,
+                     performance_cls, params)
+    b.simulate_trading(output=False)
+    total = b.account_record['total'] if keep_total else None
+    return params, b.performance.create_performance(), b.transactions, total
+
+
+def open_pool(shared, processes=None):
+    """Pool of processes attached to the shared market data. The workers
+    keep their feature caches until the pool is closed.
+    """
+    return Pool(processes, initializer=_attach, initargs=(shared.spec,))
+
+
+def run_backtests(pool, tasks):
+    """Run the tasks, see _run, in the order of the tasks.
+    """
+    return pool.map(_run, tasks)
+
+
+def results_table(results, names, performance_cls=Performance):
+    """DataFrame of the results of run_backtests, one row per task, with
+    the parameters, the performance figures and the number of transactions.
+    """
+    rows = []
+    for params, figures, transactions, _ in results:
+        row = dict(params)
+        row.update(zip(performance_cls.metrics, figures))
+        row['transactions'] = transactions
+        rows.append(row)
+    columns = list(names) + list(performance_cls.metrics) + ['transactions']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def parameter_grid(grid):
+    """All the combinations of a dictionary of lists, as dictionaries.
+    """
+    names = sorted(grid.keys())
+    return [dict(zip(names, values)) for values in
+            itertools.product(*[grid[n] for n in names])]
+
+
+def sweep(strategy_cls, grid, tickers, benchmarks, initial_capital,
+          processes=None, engine='event', performance_cls=Performance):
+    """Backtest a strategy for every combination of a parameter grid,
+    distributing the combinations over a pool of processes.
+
+    The market data is loaded once in this process and shared with the
+    workers through memory-mapped files. Each worker computes the features
+    of its combinations, reusing the indicators it has computed before.
+
+    Parameters
+    ----------
+    strategy_cls : (Class)
+        Must declare its indicators with `features(**params)`.
+    grid : dictionary, (parameter: list of values)
+        e.g. {'short_window': [5, 10], 'long_window': [20, 30, 60]}
+    tickers : list of string
+    benchmarks : list of string
+    initial_capital : float
+    processes : int, optional
+        Number of workers, the number of cores by default.
+    engine : string
+        'event' for Backtest, or 'vectorized' for VectorizedBacktest if the
+        strategy implements target_weights.
+    performance_cls : (Class)
+
+    Returns
+    -------
+    DataFrame : one row per combination, with the parameters, the figures
+        of create_performance and the number of transactions.
+    """
+    shared = SharedMarketData(tickers, benchmarks)
+    pool = open_pool(shared, processes)
+    try:
+        results = run_backtests(pool, [(tickers, benchmarks, initial_capital,
+                                        strategy_cls, performance_cls, engine,
+                                        p, (None, None), False)
+                                       for p in parameter_grid(grid)])
+    finally:
+        pool.close()
+        pool.join()
+        shared.close()
+    return results_table(results, sorted(grid.keys()), performance_cls)
+
+
+if __name__ == '__main__':
+    from strategy.sma_cross import MovingAverage
+    table = sweep(MovingAverage,
+                  {'short_window': [5, 10, 20], 'long_window': [30, 60, 120]},
+                  ['600030.SH'], ['600030.SH'], 100.)
+    print(table.sort_values('sharpe', ascending=False))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:56:12 2026
+
+@author: Yibing
+"""
+import os
+import glob
+import time
+import argparse
+from multiprocessing import Pool
+
+from resample_tick_data import clean_raw_data, resample_multi, \
+    resample_incremental, read_watermark
+
+
+def resample_file(args):
+    """Clean one tick file once and write its bars at every frequency.
+
+    Parameters
+    ----------
+    args : tuple. (file_name, freqs, output_dir, incremental)
+        The bars of frequency f are written to output_dir/f/<ticker>.csv
+        If incremental, only the ticks after the watermark of each output
+        are read, resampled and appended to it.
+
+    Returns
+    -------
+    tuple : (ticker, number of ticks, seconds spent)
+    """
+    file_name, freqs, output_dir, incremental = args
+    start = time.time()
+    ticker = os.path.splitext(os.path.basename(file_name))[0]
+    outputs = dict((freq, os.path.join(output_dir, freq, '%s.csv' % ticker))
+                   for freq in freqs)
+    after = None
+    if incremental:
+        # the history up to the earliest watermark is not read at all
+        watermarks = [read_watermark(o) for o in outputs.values()]
+        if all(w is not None for w in watermarks):
+            after = min(watermarks)
+    raw_df = clean_raw_data(file_name, after)
+    for freq in freqs:
+        path = os.path.join(output_dir, freq)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    if incremental:
+        for freq in freqs:
+            resample_incremental(raw_df, freq, outputs[freq])
+    else:
+        for freq, bars in resample_multi(raw_df, freqs).items():
+            bars.drop('date', axis=1).to_csv(outputs[freq], 
+                                             index_label='datetime')
+    return ticker, len(raw_df), time.time() - start
+
+
+def batch_resample(input_dir, output_dir, freqs, processes=None, 
+                   incremental=False):
+    """Resample every tick file of `input_dir` to several frequencies,
+    distributing the files over a pool of processes.
+
+    Returns
+    -------
+    dictionary : files, ticks, seconds, files_per_minute, ticks_per_second
+    """
+    files = sorted(glob.glob(os.path.join(input_dir, '*.csv')))
+    start = time.time()
+    ticks = 0
+    pool = Pool(processes)
+    try:
+        for ticker, n, spent in pool.imap_unordered(
+                resample_file, [(f, freqs, output_dir, incremental) 
+                                for f in files]):
+            ticks += n
+            print('Resampled %s: %d ticks in %.2fs' % (ticker, n, spent))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = max(time.time() - start, 1e-9)
+    report = {'files': len(files),
+              'ticks': ticks,
+              'seconds': elapsed,
+              'files_per_minute': len(files) / elapsed * 60.,
+              'ticks_per_second': ticks / elapsed}
+    print('%(files)d files, %(ticks)d ticks in %(seconds).2fs: '
+          '%(files_per_minute).1f files/minute, '
+          '%(ticks_per_second).0f ticks/second' % report)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resample the tick files.')
+    parser.add_argument('--input', default='stocks')
+    parser.add_argument('--output', default=os.path.join('..', 'resampled_data'))
+    parser.add_argument('--freqs', default='1min,5min,30min,1D')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help='append the ticks after the watermarks only')
+    args = parser.parse_args()
+    batch_resample(args.input, args.output, args.freqs.split(','),
+                   args.processes, args.incremental)
@@ -4,13 +4,98 @@ Created on Thu Jul 14 11:18:42 2016
 
 @author: Yibing
 """
+import os
+import json
+
 import pandas as pd
 import numpy as np
-import datetime
 
 column_names = "time,price,quantity,amount,num,side,volume,turnover,ask_price,ask_qty,bid_price,bid_qty,ask_avg_price,bid_avg_price,total_ask_qty,total_bid_qty".split(",")
 
-def clean_raw_data(file_name):
+def _digits_to_int(digits, start, stop):
+    """Integer value of the fixed width digit columns [start, stop).
+    """
+    value = np.zeros(len(digits), dtype=np.int64)
+    for j in range(start, stop):
+        value = value * 10 + digits[:, j]
+    return value
+
+
+def _clean_frame(df, seen=None):
+    """Vectorized session filter, duplicate removal and index conversion of
+    raw tick rows indexed by 'YYYYMMDD HHMMSSffffff' strings.
+    
+    Parameters
+    ----------
+    df : DataFrame
+    seen : 1d array of bytes, optional
+        Raw timestamps already kept before, e.g. in the previous chunk.
+    
+    Returns
+    -------
+    (Dataframe, 1d array of bytes) 
+        The cleaned rows and their raw timestamps.
+    """
+    raw = np.asarray(df.index.values).astype('S')
+    # one row of ascii codes per timestamp, padded with zeros
+    codes = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    digits = codes.astype(np.int64) - ord('0')
+    
+    hour = _digits_to_int(digits, 9, 11)
+    minute = _digits_to_int(digits, 11, 13)
+    second = _digits_to_int(digits, 13, 15)
+    microsecond = np.zeros(len(raw), dtype=np.int64)
+    for j in range(15, raw.dtype.itemsize):
+        present = codes[:, j] != 0
+        microsecond[present] = microsecond[present] * 10 + digits[present, j]
+    
+    # some of the indices might be wrong since they contain seconds larger than 60,
+    # therefore, we need to ensure the indices fall into the right range
+    hhmm = hour * 100 + minute
+    qualified = (((hhmm >= 930) & (hhmm < 1130)) | 
+                 ((hhmm >= 1300) & (hhmm < 1500))) & (second < 60)
+    # eliminate possible duplicate indices
+    qualified &= ~pd.Index(raw).duplicated(keep='first')
+    if seen is not None:
+        qualified &= ~np.isin(raw, seen)
+    
+    converted_index = pd.DatetimeIndex(pd.to_datetime(pd.DataFrame({
+        'year': _digits_to_int(digits, 0, 4)[qualified],
+        'month': _digits_to_int(digits, 4, 6)[qualified],
+        'day': _digits_to_int(digits, 6, 8)[qualified],
+        'hour': hour[qualified],
+        'minute': minute[qualified],
+        'second': second[qualified],
+        'us': microsecond[qualified]})))
+    cleaned = df[qualified]
+    cleaned.index = converted_index
+    return cleaned, raw[qualified]
+    
+
+def _seek_second(f, after):
+    """Move a binary file of raw ticks sorted by time to the first line of 
+    the second of `after` or later, by bisection of the byte offsets.
+    """
+    key = after.strftime('%Y%m%d %H%M%S').encode()
+    f.seek(0, os.SEEK_END)
+    lo, hi = 0, f.tell()
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        if mid:
+            # the first line starting after mid
+            f.readline()
+        line = f.readline()
+        if not line or line[:len(key)] >= key:
+            hi = mid
+        else:
+            lo = mid + 1
+    f.seek(lo)
+    if lo:
+        f.readline()
+    
+
+def clean_raw_data(file_name, after=None):
     """First step to preprocess the raw data, delete rows which are irrelevant
     and reset the index as timestamp
     
@@ -18,37 +103,97 @@ def clean_raw_data(file_name):
     ----------
     file_name : string
         full path of the data file
+    after : Timestamp, optional
+        Only read the ticks from the second of `after` on, e.g. after the 
+        watermark of an incremental resampling. The file must be sorted by
+        time, the rows before are skipped without being parsed, so the 
+        cost is that of the new ticks, not of the history.
     
     Returns
     -------
     Dataframe 
     
     """
-#    def parser(date):
-#        return datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
-        
-    df = pd.read_csv(file_name, index_col=0, names=column_names, 
-                     parse_dates=['time'])
-                     
-    # some of the indices might be wrong since they contain seconds larger than 60,
-    # therefore, we need to ensure the indices fall into the right range
-    qualified_index = map(lambda x: ((x.split(' ')[1] >= '0930') & (x.split(' ')[1] <= '1130')) | \
-                             ((x.split(' ')[1] >= '1300') & (x.split(' ')[1] <= '1500')),
-                             df.index)
-                             
-    # eliminate possible duplicate indices
-    df = df[qualified_index].reset_index().drop_duplicates(subset='time', keep='first').set_index('time')
-    converted_index = map(lambda x: pd.datetime(year=int(x.split(' ')[0][:4]),
-                                               month=int(x.split(' ')[0][4:6]),
-                                               day=int(x.split(' ')[0][6:]),
-                                               hour=int(x.split(' ')[1][:2]),
-                                               minute=int(x.split(' ')[1][2:4]),
-                                               second=int(x.split(' ')[1][4:6]),
-                                               microsecond=int(x.split(' ')[1][6:])),
-                         df.index)
-#    converted_index = map(lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'),
-#                          df.index)
-    return pd.DataFrame(df.values, columns=column_names[1:], index=converted_index)
+    if after is None:
+        df = pd.read_csv(file_name, index_col=0, names=column_names, 
+                         dtype={'time': str})
+        return _clean_frame(df)[0]
+    with open(file_name, 'rb') as f:
+        _seek_second(f, pd.Timestamp(after))
+        df = pd.read_csv(f, index_col=0, names=column_names, 
+                         dtype={'time': str})
+    return _clean_frame(df)[0]
+    
+
+def iter_clean_raw_data(file_name, chunksize=1000000):
+    """Chunked version of clean_raw_data for files larger than memory.
+    
+    Parameters
+    ----------
+    file_name : string
+        full path of the data file
+    chunksize : int
+        number of raw rows read at a time
+    
+    Returns
+    -------
+    Generator of Dataframe
+    
+    Notice
+    ------
+    Duplicates are detected within a chunk and against the previous chunk,
+    which covers the tick files sorted by time.
+    """
+    seen = None
+    for chunk in pd.read_csv(file_name, index_col=0, names=column_names, 
+                             dtype={'time': str}, chunksize=chunksize):
+        cleaned, raw = _clean_frame(chunk, seen)
+        seen = raw
+        if len(cleaned):
+            yield cleaned
+    
+
+def _aggregate(raw_df, freq, origin='start_day'):
+    """Aggregates of the ticks in each interval, which can be merged into
+    coarser intervals later. Intervals without any tick are dropped.
+    
+    The origin only applies to fixed frequencies, e.g. '5min', days are
+    always cut at midnight.
+    """
+    kwargs = {'closed': 'left', 'label': 'right'}
+    if isinstance(pd.tseries.frequencies.to_offset(freq), pd.offsets.Tick):
+        kwargs['origin'] = origin
+    price = raw_df['price'].resample(freq, **kwargs)
+    qty_amt = raw_df.loc[:, ['quantity', 'amount']].resample(
+        freq, **kwargs).sum()
+    agg = pd.concat([price.ohlc(), price.sum().rename('price_sum'), 
+                     price.count().rename('count'), qty_amt], axis=1)
+    return agg[agg['count'] > 0]
+    
+    
+def _coarsen(agg, freq):
+    """Merge the aggregates of finer intervals, labeled by their right edge,
+    into intervals of `freq`.
+    """
+    bins = agg.resample(freq, closed='right', label='right')
+    coarse = pd.concat([bins['open'].first(), bins['high'].max(), 
+                        bins['low'].min(), bins['close'].last(),
+                        bins[['price_sum', 'count', 'quantity', 'amount']].sum()], 
+                       axis=1)
+    return coarse[coarse['count'] > 0]
+    
+    
+def _finalize(agg):
+    """Turn the aggregates into the bars written to resampled_data.
+    """
+    bars = agg.loc[:, ['open', 'high', 'low', 'close']]
+    bars['ewap'] = agg['price_sum'] / agg['count']
+    bars['vwap'] = agg['amount'] / agg['quantity']
+    bars['transaction'] = agg['open'].shift(-1)
+    bars['quantity'] = agg['quantity']
+    bars['amount'] = agg['amount']
+    bars['date'] = bars.index
+    return bars.dropna()
     
 
 def resample(raw_df, freq):
@@ -65,20 +210,118 @@ def resample(raw_df, freq):
         transaction : price at which transaction actually occurs, 
             approximated by the open price at the next period
     """
-    ohlc = raw_df['price'].resample(freq, closed='left', label='right').ohlc().dropna()
-    ewap = raw_df['price'].resample(freq, closed='left', label='right').mean().dropna()
-    ewap.name = 'ewap'
-    qty_amt = raw_df.loc[:, ['quantity', 'amount']].resample(
-        freq, closed='left', label='right').sum().dropna()
-    vwap = qty_amt['amount'] / qty_amt['quantity']
-    vwap.name = 'vwap'
-    transaction = ohlc['open'].shift(-1).dropna()
-    transaction.name = 'transaction'
-    concat = pd.concat([ohlc, ewap, vwap, transaction, qty_amt], axis=1,
-                       join='inner')
-    concat['date'] = concat.index
+    return _finalize(_aggregate(raw_df, freq))
+    
+    
+def resample_multi(raw_df, freqs):
+    """Resample the tick data to several frequencies in one pass. Only the 
+    finest frequency is computed from the ticks, every coarser one is merged
+    from the finest already computed frequency which divides it.
+    
+    Parameters
+    ----------
+    raw_df : DataFrame
+        cleaned tick data
+    freqs : list of string
+        e.g. ['1min', '5min', '30min', '1D']
+        
+    Returns
+    -------
+    Dictionary, (freq: DataFrame)
+    """
+    ordered = sorted(freqs, key=pd.Timedelta)
+    aggs = [(ordered[0], _aggregate(raw_df, ordered[0]))]
+    for freq in ordered[1:]:
+        step = pd.Timedelta(freq)
+        finer = [(f, a) for f, a in aggs if step % pd.Timedelta(f) == pd.Timedelta(0)]
+        if finer:
+            aggs.append((freq, _coarsen(finer[-1][1], freq)))
+        else:
+            aggs.append((freq, _aggregate(raw_df, freq)))
+    return dict((f, _finalize(a)) for f, a in aggs)
+    
+def read_watermark(output_file):
+    """Timestamp of the last tick resampled into `output_file` by 
+    resample_incremental, None if it has none yet.
+    """
+    state_file = output_file + '.watermark'
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file) as f:
+        return pd.Timestamp(json.load(f)['watermark'])
+    
 
-    return concat.dropna()
+def resample_incremental(raw_df, freq, output_file):
+    """Append the bars of the ticks newer than the watermark of 
+    `output_file` to it, so that a daily refresh only processes the new day.
+    
+    The state is kept next to the output in `output_file + '.watermark'`:
+    the timestamp of the last processed tick, the origin of the intervals
+    and the aggregates of the last bar. The last bar is never written 
+    before the next one exists, since its transaction price is the open of
+    the next bar, and the new ticks might still fall into its interval.
+    Start with the full history, the result is then the same as resample().
+    
+    Parameters
+    ----------
+    raw_df : DataFrame
+        cleaned tick data, only the ticks after the watermark are used, 
+        e.g. clean_raw_data(file_name, read_watermark(output_file))
+    freq : string
+    output_file : string
+        csv file of the bars, created if it does not exist
+        
+    Returns
+    -------
+    int : number of bars appended
+    """
+    state_file = output_file + '.watermark'
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+        origin = pd.Timestamp(state['origin'])
+        new = raw_df[raw_df.index > pd.Timestamp(state['watermark'])]
+    else:
+        if os.path.exists(output_file):
+            raise ValueError('%s has no watermark, resample the full history '
+                             'into a new file first' % output_file)
+        state = None
+        origin = raw_df.index[0].normalize()
+        new = raw_df
+    if len(new) == 0:
+        return 0
+        
+    agg = _aggregate(new, freq, origin=origin)
+    if state is not None:
+        pending = pd.DataFrame(state['pending'], index=[pd.Timestamp(state['label'])])
+        if agg.index[0] == pending.index[0]:
+            # the boundary bar continues with the new ticks
+            first = agg.iloc[0].copy()
+            first['open'] = pending['open'].iloc[0]
+            first['high'] = max(first['high'], pending['high'].iloc[0])
+            first['low'] = min(first['low'], pending['low'].iloc[0])
+            for c in ['price_sum', 'count', 'quantity', 'amount']:
+                first[c] += pending[c].iloc[0]
+            agg.iloc[0] = first
+        else:
+            agg = pd.concat([pending[agg.columns], agg])
+            
+    bars = _finalize(agg).drop('date', axis=1)
+    bars.to_csv(output_file, mode='a', header=state is None, 
+                index_label='datetime')
+                
+    last = agg.iloc[-1]
+    state = {'watermark': new.index[-1].isoformat(),
+             'origin': origin.isoformat(),
+             'label': agg.index[-1].isoformat(),
+             'pending': dict((c, [float(last[c])]) for c in agg.columns)}
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    os.rename(state_file + '.tmp', state_file)
+    return len(bars)
+    
 
 if __name__ == '__main__':
     df = clean_raw_data('stocks/600030.SH.csv')
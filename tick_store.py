@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:24:11 2026
+
+@author: Yibing
+"""
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+
+from tick_data.resample_tick_data import column_names, iter_clean_raw_data
+
+# One fixed-width record per tick: the time in nanoseconds since the epoch,
+# followed by the numeric columns of the raw tick files. side is +1 for a
+# buy, -1 for a sell and 0 if unknown.
+TICK_DTYPE = np.dtype([('time', '<i8')] +
+                      [(c, '<f8') for c in column_names[1:]])
+
+
+def _side_codes(values):
+    """side as numbers, the letters 'B' and 'S' mapped to +1 and -1.
+    """
+    codes = pd.to_numeric(pd.Series(values), errors='coerce')
+    letters = pd.Series(values).astype(str).str.upper().str[:1]
+    codes[letters == 'B'] = 1.
+    codes[letters == 'S'] = -1.
+    return codes.fillna(0.).values
+
+
+def _day_numbers(times):
+    """Day of each time in nanoseconds, as YYYYMMDD.
+    """
+    days = pd.DatetimeIndex(np.asarray(times).view('datetime64[ns]'))
+    return (days.year * 10000 + days.month * 100 + days.day).values
+
+
+def to_records(ticks):
+    """Cleaned ticks, e.g. from clean_raw_data, as an array of TICK_DTYPE.
+    """
+    records = np.zeros(len(ticks), dtype=TICK_DTYPE)
+    records['time'] = np.asarray(ticks.index.values,
+                                 dtype='datetime64[ns]').view(np.int64)
+    for c in column_names[1:]:
+        if c not in ticks.columns:
+            continue
+        if c == 'side':
+            records[c] = _side_codes(ticks[c].values)
+        else:
+            records[c] = pd.to_numeric(ticks[c], errors='coerce').values
+    return records
+
+
+class TickStore(object):
+    """Binary store of tick data, one file of fixed-width records per
+    ticker and day.
+
+    The ticks of a day are kept sorted by time in `<root>/<ticker>/<day>.npy`
+    as an array of TICK_DTYPE, which is memory-mapped when it is read. The
+    time range of every day is kept in `<root>/<ticker>/index.npy`, so that a
+    time range is found without opening the files outside of it, and within
+    a day by a binary search on the times. The ticks of a range are then
+    slices of the memory-mapped files, nothing is copied or parsed.
+
+    Parameters
+    ----------
+    root : string
+        Directory of the store.
+    """
+    index_dtype = np.dtype([('day', '<i8'), ('start', '<i8'), ('end', '<i8'),
+                            ('count', '<i8')])
+
+    def __init__(self, root):
+        self.root = root
+
+    def ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker)
+
+    def day_file(self, ticker, day):
+        return os.path.join(self.ticker_dir(ticker), '%d.npy' % day)
+
+    def tickers(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(t for t in os.listdir(self.root) if
+                      os.path.exists(os.path.join(self.root, t, 'index.npy')))
+
+    def index(self, ticker):
+        """Array of index_dtype, (day as YYYYMMDD, time of the first and of
+        the last tick, number of ticks) of each day in the store.
+        """
+        path = os.path.join(self.ticker_dir(ticker), 'index.npy')
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=self.index_dtype)
+        return np.load(path)
+
+    def _save(self, path, values):
+        # write aside and move in place, readers never see a partial file
+        tmp = path + '.tmp.npy'
+        np.save(tmp, values)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+
+    def write(self, ticker, ticks):
+        """Add ticks to the store, merged with the days already stored.
+
+        The ticks replace those already stored at the same times, so that
+        writing the same ticks twice leaves the store unchanged.
+
+        Parameters
+        ----------
+        ticker : string
+        ticks : DataFrame or array of TICK_DTYPE
+            Cleaned ticks indexed by datetime, e.g. from clean_raw_data.
+
+        Returns
+        -------
+        int : number of ticks written.
+        """
+        if isinstance(ticks, pd.DataFrame):
+            ticks = to_records(ticks)
+        if len(ticks) == 0:
+            return 0
+        self._update_index(ticker, self._write_days(ticker, ticks))
+        return len(ticks)
+
+    def _write_days(self, ticker, ticks):
+        """Merge ticks into their day files, returns the index rows of the
+        days written.
+        """
+        path = self.ticker_dir(ticker)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        days = _day_numbers(ticks['time'])
+        rows = []
+        for day in np.unique(days):
+            new = ticks[days == day]
+            if os.path.exists(self.day_file(ticker, day)):
+                old = np.load(self.day_file(ticker, day))
+                old = old[~np.isin(old['time'], new['time'])]
+                new = np.concatenate([old, new])
+            new = new[np.argsort(new['time'], kind='mergesort')]
+            self._save(self.day_file(ticker, day), new)
+            rows.append((day, new['time'][0], new['time'][-1], len(new)))
+        return rows
+
+    def _update_index(self, ticker, rows):
+        """Replace the index rows of the days written, the other days are
+        left as they are.
+        """
+        index = self.index(ticker)
+        written = [r[0] for r in rows]
+        index = np.concatenate([index[~np.isin(index['day'], written)],
+                                np.array(rows, dtype=self.index_dtype)])
+        self._save(os.path.join(self.ticker_dir(ticker), 'index.npy'),
+                   np.sort(index, order='day'))
+
+    def reindex(self, ticker):
+        """Rebuild the index of the days of a ticker from its files.
+        """
+        rows = []
+        for f in glob.glob(os.path.join(self.ticker_dir(ticker), '*.npy')):
+            name = os.path.splitext(os.path.basename(f))[0]
+            if not name.isdigit():
+                continue
+            times = np.load(f, mmap_mode='r')['time']
+            if len(times):
+                rows.append((int(name), times[0], times[-1], len(times)))
+        index = np.array(sorted(rows), dtype=self.index_dtype)
+        self._save(os.path.join(self.ticker_dir(ticker), 'index.npy'), index)
+
+    def import_csv(self, ticker, file_name, chunksize=1000000):
+        """Clean a raw tick file chunk by chunk and write it to the store.
+
+        The ticks of a day are gathered over the chunks and the day file is
+        written once, when the file moves on to the next day, and the index
+        is updated once at the end. The file is expected sorted by time.
+
+        Returns
+        -------
+        int : number of ticks written.
+        """
+        pending, pending_day = [], None
+        rows = []
+        count = 0
+        for chunk in iter_clean_raw_data(file_name, chunksize):
+            ticks = to_records(chunk)
+            count += len(ticks)
+            days = _day_numbers(ticks['time'])
+            # the days before the last one of the chunk are complete
+            done = days != days[-1]
+            if pending and pending_day != days[-1]:
+                rows += self._write_days(ticker, np.concatenate(
+                    pending + [ticks[done]]))
+                pending = []
+            elif done.any():
+                rows += self._write_days(ticker, ticks[done])
+            pending.append(ticks[~done])
+            pending_day = days[-1]
+        if pending:
+            rows += self._write_days(ticker, np.concatenate(pending))
+        if rows:
+            self._update_index(ticker, rows)
+        return count
+
+    def slices(self, ticker, start=None, end=None):
+        """Ticks of a ticker in [start, end), one memory-mapped slice per
+        day, in time order.
+
+        Parameters
+        ----------
+        ticker : string
+        start, end : datetime-like, optional
+            The whole store by default.
+
+        Returns
+        -------
+        generator of arrays of TICK_DTYPE
+        """
+        lower = -np.inf if start is None else pd.Timestamp(start).value
+        upper = np.inf if end is None else pd.Timestamp(end).value
+        index = self.index(ticker)
+        for day in index[(index['end'] >= lower) & (index['start'] < upper)]:
+            ticks = np.load(self.day_file(ticker, day['day']), mmap_mode='r')
+            times = ticks['time']
+            lo = 0 if lower <= day['start'] else \
+                np.searchsorted(times, lower, 'left')
+            hi = len(ticks) if upper > day['end'] else \
+                np.searchsorted(times, upper, 'left')
+            if hi > lo:
+                yield ticks[lo:hi]
+
+    def read(self, ticker, start=None, end=None):
+        """Ticks of a ticker in [start, end) as a DataFrame indexed by
+        datetime, copied into memory.
+        """
+        parts = list(self.slices(ticker, start, end))
+        ticks = np.concatenate(parts) if parts else \
+            np.zeros(0, dtype=TICK_DTYPE)
+        frame = pd.DataFrame(dict((c, ticks[c]) for c in column_names[1:]),
+                             columns=column_names[1:])
+        frame.index = pd.DatetimeIndex(ticks['time'].view('datetime64[ns]'),
+                                       name='datetime')
+        return frame
+
+
+class TickReplayFeed(object):
+    """Feed of the event engine which replays the ticks of a ticker from a
+    TickStore, a day at a time.
+
+    Every trade price is the open, high, low, close and transaction price of
+    its tick, so that resting orders are checked against each trade, and the
+    quotes are fed as 'bid' and 'ask' to model the execution, see
+    order_handler.QuoteOrderHandler. A quote of zero, i.e. an empty side of
+    the book, is fed as nan.
+
+    Parameters
+    ----------
+    store : TickStore
+    ticker : string
+    start, end : datetime-like, optional
+        Range [start, end) to replay, the whole store by default.
+    """
+    fields = ['open', 'high', 'low', 'close', 'transaction', 'bid', 'ask',
+              'quantity']
+
+    def __init__(self, store, ticker, start=None, end=None):
+        self.store = store
+        self.ticker = ticker
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        for ticks in self.store.slices(self.ticker, self.start, self.end):
+            values = np.empty((len(ticks), len(self.fields)))
+            values[:, :5] = ticks['price'][:, np.newaxis]
+            values[:, 5] = ticks['bid_price']
+            values[:, 6] = ticks['ask_price']
+            values[:, 7] = ticks['quantity']
+            values[:, 5:7][values[:, 5:7] <= 0.] = np.nan
+            for item in zip(ticks['time'].tolist(), values):
+                yield item
+
+
+if __name__ == '__main__':
+    from event_engine import EventBacktest
+    from order_handler import QuoteOrderHandler
+    from performance import Performance
+    from position_handler import PositionHandler
+    from strategy.buy_hold import BuyHold
+
+    store = TickStore(u'C:\\Users\\Yibing\\Documents\\Python\\back_test\\tick_store')
+    if '600030.SH' not in store.tickers():
+        store.import_csv('600030.SH', 'tick_data/stocks/600030.SH.csv')
+    # replay a month of ticks, filled at the quotes
+    b = EventBacktest([TickReplayFeed(store, '600030.SH', '2015-06-01',
+                                      '2015-07-01')],
+                      ['600030.SH'], ['600030.SH'], 100., PositionHandler,
+                      QuoteOrderHandler, BuyHold, Performance)
+    b.simulate_trading()
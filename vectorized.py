@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:01:17 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest, create_data_handler, PERIODS
+from order_handler import OrderHandler
+from position_handler import PositionHandler
+
+
+def simulate_weights(weights, close, transaction, initial_capital,
+                     transaction_rate=0.0015):
+    """Cash and equity of a target-weight strategy, computed with arrays.
+
+    Follows the assumptions of the event-driven engine: an order is filled
+    at the transaction price of the bar of its signal, a position is marked
+    to market at the close, and the commission is charged on entry and on
+    exit. Only the bars where a weight changes are visited one by one, the
+    equity in between is evaluated for whole segments at once.
+
+    Parameters
+    ----------
+    weights : 2d array
+        (bars, tickers) target weights. A change from 0 to w enters the
+        market with the weight w against cash, and a change from w to 0
+        closes out the full position, as the 'ENTER' and 'EXIT' signals.
+    close : 2d array
+        (bars, tickers) close prices.
+    transaction : 2d array
+        (bars, tickers) transaction prices.
+    initial_capital : float
+    transaction_rate : float
+
+    Returns
+    -------
+    tuple : (cash, total, quantities, number of trades), where cash and
+        total are 1d arrays of the bars and quantities is (bars, tickers).
+
+    Notice
+    ------
+    As in PositionHandler.update_from_order, the total of a bar with trades
+    counts only the realizable value of the tickers traded at that bar.
+    """
+    bars, num = weights.shape
+    previous = np.vstack([np.zeros((1, num)), weights[:-1]])
+    changed = weights != previous
+    entering = changed & (previous == 0.)
+    exiting = changed & (weights == 0.)
+    if (changed & ~entering & ~exiting).any():
+        raise ValueError('A weight can only change from or to zero')
+    events = np.flatnonzero(changed.any(axis=1))
+
+    cash_path = np.empty(bars)
+    total_path = np.empty(bars)
+    quantities = np.zeros((bars, num))
+    qty = np.zeros(num)
+    cost = np.zeros(num)
+    cash = float(initial_capital)
+    start = 0
+    for e in list(events) + [bars]:
+        # positions are constant until the next trade
+        if e > start:
+            cash_path[start:e] = cash
+            quantities[start:e] = qty
+            held = np.flatnonzero(qty)
+            if len(held):
+                q, c = qty[held], cost[held]
+                d = np.where(q > 0., -1., 1.)
+                realizable = c + (close[start:e][:, held] * q + d * c)
+                total_path[start:e] = cash + realizable.sum(axis=1)
+            else:
+                total_path[start:e] = cash
+        if e == bars:
+            break
+
+        # mark to market at the close before the orders
+        realizable = np.zeros(num)
+        held = np.flatnonzero(qty)
+        if len(held):
+            q, c = qty[held], cost[held]
+            d = np.where(q > 0., -1., 1.)
+            realizable[held] = c + (close[e, held] * q + d * c)
+
+        price = transaction[e]
+        transaction_cost = 0.
+        traded = 0.
+        for k in np.flatnonzero(exiting[e]):
+            transaction_cost += abs(qty[k] * price[k]) * transaction_rate
+            cash += realizable[k]
+            qty[k] = cost[k] = 0.
+        alloc = cash
+        for k in np.flatnonzero(entering[e]):
+            q = alloc * weights[e, k] / ((1. + transaction_rate) * price[k])
+            transaction_cost += abs(q * price[k]) * transaction_rate
+            if round(q, 3) == 0.:
+                continue
+            new_cost = abs(q * price[k])
+            upnl = price[k] * q - new_cost if q > 0 else price[k] * q + new_cost
+            qty[k], cost[k] = q, new_cost
+            traded += new_cost + upnl
+            cash -= abs(q * price[k])
+        cash -= transaction_cost
+
+        cash_path[e] = cash
+        total_path[e] = cash + traded
+        quantities[e] = qty
+        start = e + 1
+
+    return cash_path, total_path, quantities, len(events)
+
+
+class VectorizedBacktest(object):
+    """Backtest of a strategy which returns its target weights for all the
+    bars at once, without stepping through the bars in Python.
+
+    The strategy must implement a static `target_weights(data_handler)`
+    method returning a (bars, tickers) array, see simulate_weights.
+
+    Parameters
+    ----------
+    tickers : list of string
+    benchmarks : list of string
+    initial_capital : float
+    data_handler_cls : (Class)
+        Must load the whole history into a panel, e.g. CSVDataHandler.
+    strategy_cls : (Class)
+    performance_cls : (Class)
+    strategy_params : dictionary, optional
+
+    Attributes
+    ----------
+    data_handler : instance
+    strategy : instance
+        Built without a position handler, only its name is used.
+    account_record : DataFrame
+        cash and total along the index, also position_record as there are
+        no positions to record beyond the quantities.
+    quantities : DataFrame
+        quantity of each ticker along the index.
+    transactions : int
+    """
+    def __init__(self, tickers, benchmarks, initial_capital, data_handler_cls,
+                 strategy_cls, performance_cls, strategy_params=None):
+        strategy_params = strategy_params or {}
+        self.data_handler = create_data_handler(data_handler_cls, strategy_cls,
+                                                tickers, benchmarks,
+                                                strategy_params)
+        self.tickers = tickers
+        self.initial_capital = initial_capital
+        self.strategy_cls = strategy_cls
+        self.strategy = strategy_cls(self.data_handler, None,
+                                     **strategy_params)
+        self.performance_cls = performance_cls
+        self.transactions = 0
+
+    def simulate_trading(self, output=True):
+        """Executes the backtest.
+        """
+        panel = self.data_handler.panel
+        weights = np.asarray(self.strategy_cls.target_weights(self.data_handler),
+                             dtype=np.float64)
+        cash, total, quantities, self.transactions = simulate_weights(
+            weights, panel.field('close'), panel.field('transaction'),
+            self.initial_capital)
+
+        index = self.data_handler.index
+        bankrupt = np.flatnonzero(total < 0)
+        if len(bankrupt):
+            print('Bankruptcy! GAME OVER')
+            end = bankrupt[0] + 1
+            cash, total, quantities = cash[:end], total[:end], quantities[:end]
+            index = index[:end]
+        print('Number of transactions: %d' % self.transactions)
+        print('\n')
+
+        index = pd.DatetimeIndex(index, name='datetime')
+        self.account_record = pd.DataFrame({'cash': cash, 'total': total},
+                                           index=index,
+                                           columns=['cash', 'total'])
+        self.position_record = self.account_record
+        self.quantities = pd.DataFrame(quantities, index=index,
+                                       columns=self.tickers)
+        self.performance = self.performance_cls(self.data_handler,
+                                                self.account_record,
+                                                PERIODS, self.strategy.name)
+        if output:
+            self.performance.output_performance()
+
+
+def check_consistency(tickers, benchmarks, initial_capital, data_handler_cls,
+                      strategy_cls, performance_cls, strategy_params=None,
+                      rtol=1e-9):
+    """Run the event-driven and the vectorized engines on the same data and
+    check that their equity curves and performance figures match.
+
+    Returns
+    -------
+    float : the largest absolute difference between the equity curves.
+    """
+    event = Backtest(tickers, benchmarks, initial_capital, data_handler_cls,
+                     PositionHandler, OrderHandler, strategy_cls,
+                     performance_cls, strategy_params)
+    event.simulate_trading(output=False)
+    fast = VectorizedBacktest(tickers, benchmarks, initial_capital,
+                              data_handler_cls, strategy_cls, performance_cls,
+                              strategy_params)
+    fast.simulate_trading(output=False)
+
+    expected = event.account_record['total']
+    actual = fast.account_record['total']
+    if not expected.index.equals(actual.index):
+        raise AssertionError('The engines recorded different bars')
+    diff = np.abs(expected.values - actual.values).max()
+    if not np.allclose(actual.values, expected.values, rtol=rtol, atol=0.):
+        raise AssertionError('The equity curves differ by up to %g' % diff)
+    if event.transactions != fast.transactions:
+        raise AssertionError('%d transactions against %d' %
+                             (event.transactions, fast.transactions))
+    if not np.allclose(event.performance.create_performance(),
+                       fast.performance.create_performance(),
+                       rtol=rtol, atol=0., equal_nan=True):
+        raise AssertionError('The performance figures differ')
+    return diff
+
+
+if __name__ == '__main__':
+    from data_handler import CSVDataHandler
+    from performance import Performance
+    from strategy.sma_cross import MovingAverage
+    print(check_consistency(['600030.SH'], ['600030.SH'], 100., CSVDataHandler,
+                            MovingAverage, Performance))
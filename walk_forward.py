@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:05:14 2026
+
+@author: Yibing
+"""
+import numpy as np
+import pandas as pd
+
+from backtest import PERIODS
+from performance import Performance
+from sweep import (SharedMarketData, open_pool, run_backtests, results_table,
+                   parameter_grid)
+
+
+def walk_forward_splits(length, train_size, test_size, anchored=False):
+    """Positions of the train and test windows along an index.
+
+    The test windows follow each other without gap until the end of the
+    index, each one right after its train window.
+
+    Parameters
+    ----------
+    length : int
+        Number of bars of the index.
+    train_size : int
+        Number of bars of the train windows, of the first one if anchored.
+    test_size : int
+        Number of bars of the test windows, the last one may be shorter.
+    anchored : bool
+        If True, every train window starts at the first bar, otherwise
+        the train window rolls forward with the test window.
+
+    Returns
+    -------
+    list of tuple : (train_start, test_start, test_end), the windows are
+        [train_start, test_start) and [test_start, test_end).
+    """
+    assert train_size > 0 and test_size > 0, 'empty window'
+    splits = []
+    start = train_size
+    while start < length:
+        end = min(start + test_size, length)
+        splits.append((0 if anchored else start - train_size, start, end))
+        start = end
+    return splits
+
+
+class _Benchmarks(object):
+    # the part of a data handler read by Performance
+    def __init__(self, benchmarks):
+        self.benchmarks = benchmarks
+
+
+class WalkForward(object):
+    """Walk-forward optimization of the parameters of a strategy.
+
+    The index is split into train and test windows, see
+    walk_forward_splits. On each train window every combination of the
+    grid is backtested and the best one by `metric` is kept, it is then
+    backtested on the following test window. The equity curves of the test
+    windows are chained into one out-of-sample equity curve.
+
+    All the backtests of a stage run at once on a pool of processes. The
+    market data is loaded once and shared with the workers, and each
+    worker computes the features on the whole history once per parameter
+    combination, the windows only slice them.
+
+    Parameters
+    ----------
+    tickers : list of string
+    benchmarks : list of string
+    initial_capital : float
+    strategy_cls : (Class)
+        Must declare its indicators with `features(**params)`.
+    performance_cls : (Class)
+    grid : dictionary, (parameter: list of values)
+    train_size : int
+        Number of bars of the train windows.
+    test_size : int
+        Number of bars of the test windows.
+    anchored : bool
+        Whether every train window starts at the first bar.
+    metric : string
+        One of performance_cls.metrics, the higher the better.
+    engine : string
+        'event' or 'vectorized', see sweep.
+    processes : int, optional
+
+    Attributes
+    ----------
+    splits : list of tuple
+        (train_start, test_start, test_end) positions.
+    train_results : DataFrame
+        Figures of every combination on every train window, by fold.
+    folds : DataFrame
+        First bars of the windows, last bar of the test window, chosen
+        parameters, in-sample metric and out-of-sample figures of each fold.
+    position_record : DataFrame
+        Chained out-of-sample total along the index of the test windows.
+    performance : instance
+        Performance of the out-of-sample equity curve.
+    """
+    def __init__(self, tickers, benchmarks, initial_capital, strategy_cls,
+                 performance_cls, grid, train_size, test_size, anchored=False,
+                 metric='sharpe', engine='event', processes=None):
+        assert metric in performance_cls.metrics, 'unknown metric %s' % metric
+        self.tickers = tickers
+        self.benchmark_tickers = benchmarks
+        self.initial_capital = initial_capital
+        self.strategy_cls = strategy_cls
+        self.performance_cls = performance_cls
+        self.grid = grid
+        self.names = sorted(grid.keys())
+        self.train_size = train_size
+        self.test_size = test_size
+        self.anchored = anchored
+        self.metric = metric
+        self.engine = engine
+        self.processes = processes
+
+    def _task(self, params, start, end, keep_total):
+        return (self.tickers, self.benchmark_tickers, self.initial_capital,
+                self.strategy_cls, self.performance_cls, self.engine, params,
+                (start, end), keep_total)
+
+    def simulate_trading(self, output=True):
+        """Executes the walk-forward study.
+        """
+        shared = SharedMarketData(self.tickers, self.benchmark_tickers)
+        index = shared.index
+        self.splits = walk_forward_splits(len(index), self.train_size,
+                                          self.test_size, self.anchored)
+        assert self.splits, 'the index is shorter than the train window'
+        bound = lambda i: index[i] if i < len(index) else None
+        combinations = parameter_grid(self.grid)
+
+        pool = open_pool(shared, self.processes)
+        try:
+            # in-sample: every combination on every train window
+            tasks = [self._task(p, index[a], index[b], False)
+                     for a, b, _ in self.splits for p in combinations]
+            train = results_table(run_backtests(pool, tasks), self.names,
+                                  self.performance_cls)
+            train.insert(0, 'fold', np.repeat(np.arange(len(self.splits)),
+                                               len(combinations)))
+            best = []
+            for k in range(len(self.splits)):
+                scores = train[self.metric].values[train['fold'].values == k]
+                scores = np.where(np.isnan(scores), -np.inf, scores)
+                best.append(combinations[int(np.argmax(scores))])
+
+            # out-of-sample: the chosen combination on the next window
+            tasks = [self._task(p, index[b], bound(c), True)
+                     for p, (_, b, c) in zip(best, self.splits)]
+            test = run_backtests(pool, tasks)
+        finally:
+            pool.close()
+            pool.join()
+            shared.close()
+
+        self.train_results = train
+        self.folds = results_table(test, self.names, self.performance_cls)
+        insample = [train[self.metric].values[k * len(combinations) +
+                                              combinations.index(p)]
+                    for k, p in enumerate(best)]
+        self.folds.insert(len(self.names), 'train_' + self.metric, insample)
+        starts, ends = np.array(self.splits)[:, :2].T, np.array(self.splits)[:, 2]
+        self.folds.insert(0, 'train_start', index[starts[0]])
+        self.folds.insert(1, 'test_start', index[starts[1]])
+        self.folds.insert(2, 'test_end', index[ends - 1])
+
+        # chain the test windows, each one starts with the capital the
+        # previous one ended with
+        curves = []
+        capital = float(self.initial_capital)
+        for _, _, _, total in test:
+            curves.append(total / self.initial_capital * capital)
+            capital = curves[-1].iloc[-1]
+        total = pd.concat(curves)
+        self.position_record = pd.DataFrame({'total': total})
+        benchmarks = _Benchmarks(dict((b, s.reindex(index=total.index))
+                                      for b, s in shared.benchmarks.items()))
+        self.performance = self.performance_cls(
+            benchmarks, self.position_record, PERIODS,
+            '%s walk-forward' % self.strategy_cls.__name__)
+        if output:
+            print(self.folds)
+            print('\n')
+            self.performance.output_performance()
+
+
+if __name__ == '__main__':
+    from strategy.sma_cross import MovingAverage
+    wf = WalkForward(['600030.SH'], ['600030.SH'], 100., MovingAverage,
+                     Performance,
+                     {'short_window': [5, 10, 20], 'long_window': [30, 60]},
+                     train_size=250 * 4 * 12 // 4, test_size=250 * 4 * 12 // 12)
+    wf.simulate_trading()